@@ -0,0 +1,121 @@
+"""Local stand-ins for the external pieces of the prediction pipeline."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ETHNICITIES = [
+    "White-European", "Asian", "Middle Eastern", "black", "Hispanic", "Latino",
+    "South Asian", "mixed", "Native Indian", "Others", "Pacifica",
+]
+
+
+class StubGroqServer:
+    """An OpenAI-compatible chat completions endpoint that answers after ``latency_ms``."""
+
+    def __init__(self, latency_ms: float = 200.0) -> None:
+        latency = latency_ms / 1000.0
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))))
+                time.sleep(latency)
+                reply = json.dumps({
+                    "id": "bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "Benchmark summary. " * 20},
+                    }],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "StubGroqServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+
+
+def build_tiny_video_model(path: Path) -> Path:
+    """A few-layer Keras model with the real model's input and output shapes."""
+    import tensorflow as tf
+
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    x = tf.keras.layers.Conv2D(8, 3, strides=4, activation="relu")(inputs)
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu")(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(x)
+    tf.keras.Model(inputs, outputs).save(path)
+    return path
+
+
+def build_stub_form_model(path: Path, seed: int = 0) -> Path:
+    """A small random forest over the questionnaire's one-hot columns."""
+    import joblib
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+
+    columns = [f"A{i}" for i in range(1, 11)] + ["Age_Mons", "Sex_f", "Sex_m"]
+    columns += [f"Ethnicity_{name}" for name in ETHNICITIES]
+    columns += ["Jaundice_no", "Jaundice_yes", "Family_mem_with_ASD_no", "Family_mem_with_ASD_yes"]
+    rng = np.random.default_rng(seed)
+    features = pd.DataFrame(rng.integers(0, 2, size=(500, len(columns))), columns=columns)
+    features["Age_Mons"] = rng.integers(12, 48, size=len(features))
+    labels = (features[[f"A{i}" for i in range(1, 11)]].sum(axis=1) > 5).astype(int)
+    model = RandomForestClassifier(n_estimators=100, random_state=seed).fit(features, labels)
+    joblib.dump(model, path)
+    return path
+
+
+def make_synthetic_video(path: Path, seconds: float, width: int, height: int, fps: int = 30, seed: int = 0) -> Path:
+    """A textured clip with a moving shape and every fifth frame blurred."""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    try:
+        for index in range(int(seconds * fps)):
+            frame = np.roll(background, index * 4, axis=1)
+            centre = (int(width / 2 + width / 4 * np.sin(index / fps)), height // 2)
+            cv2.circle(frame, centre, max(8, height // 8), (255, 255, 255), -1)
+            if index % 5 == 0:
+                frame = cv2.GaussianBlur(frame, (31, 31), 0)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def random_questionnaire(rng: np.random.Generator) -> dict:
+    form = {f"A{i}": str(int(rng.integers(0, 2))) for i in range(1, 11)}
+    form.update(
+        Age_Mons=str(int(rng.integers(12, 48))),
+        Sex=str(rng.choice(["m", "f"])),
+        Ethnicity=str(rng.choice(ETHNICITIES)),
+        Jaundice=str(rng.choice(["yes", "no"])),
+        Family_mem_with_ASD=str(rng.choice(["yes", "no"])),
+    )
+    return form
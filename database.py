@@ -1,6 +1,10 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+from typing import Annotated, AsyncIterator
+
+from fastapi import Depends
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 from dotenv import load_dotenv
 import os
 
@@ -12,6 +16,101 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 if not SQLALCHEMY_DATABASE_URL:
     raise RuntimeError("DATABASE_URL environment variable is not set.")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+# Size the pool per uvicorn worker: each worker holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+_ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """Swap a sync driver in DATABASE_URL for its asyncio counterpart."""
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+ASYNC_DATABASE_URL = async_database_url(SQLALCHEMY_DATABASE_URL)
+
+_engine_options = {"pool_pre_ping": DB_POOL_PRE_PING}
+# aiosqlite opens a connection per checkout (NullPool/StaticPool) and takes no pool settings
+if not ASYNC_DATABASE_URL.startswith("sqlite"):
+    _engine_options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options)
+# Objects stay readable after commit; lazy refreshes are not possible on an AsyncSession
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+Base = declarative_base()
+
+
+def add_missing_columns(connection, metadata) -> None:
+    """Add nullable columns that the models define but an existing table lacks.
+
+    create_all only creates missing tables, so a column added to a model later
+    would otherwise make every INSERT fail on databases created before it.
+    """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    # Workers starting together may race to add the same column
+    if_not_exists = "IF NOT EXISTS " if connection.dialect.name == "postgresql" else ""
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable or column.server_default is not None:
+                print(f"⚠️ Column {table.name}.{column.name} is missing and cannot be added automatically")
+                continue
+            connection.execute(text(
+                f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {if_not_exists}"
+                f"{preparer.format_column(column)} {column.type.compile(dialect=connection.dialect)}"
+            ))
+            print(f"🛠️ Added missing column {table.name}.{column.name}")
+
+
+def create_missing_indexes(connection, metadata) -> None:
+    """Create the models' indexes that an existing table lacks; create_all skips existing tables."""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with SessionLocal() as db:
+        yield db
+
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+
+
+def pool_stats() -> dict:
+    """Connection pool utilisation for this worker."""
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {"pool": type(pool).__name__}
+    size = pool.size()
+    checked_out = pool.checkedout()
+    capacity = size + max(DB_MAX_OVERFLOW, 0)
+    return {
+        "pool": type(pool).__name__,
+        "size": size,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": checked_out,
+        "overflow": pool.overflow(),
+        "utilisation": checked_out / capacity if capacity else None,
+    }
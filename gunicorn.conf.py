@@ -0,0 +1,44 @@
+"""Multi-worker deployment: gunicorn -c gunicorn.conf.py main:app
+
+The app is imported once in the master (preload_app) with MODEL_PRELOAD set, so the
+models are loaded before the workers fork and their pages are shared copy-on-write.
+CPU_BUDGET cores are split between the workers' thread pools (services/cpu_budget.py).
+"""
+import gc
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services import cpu_budget  # noqa: E402
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Before the app (and with it NumPy and TensorFlow) is imported; THREAD_BUDGET=false
+# leaves every library at its own default
+thread_budget = (
+    cpu_budget.apply(workers) if os.getenv("THREAD_BUDGET", "true").lower() == "true" else {}
+)
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+# The TFLite artefacts can be shared too; the keras/xla video model loads in each worker
+os.environ.setdefault(
+    "MODEL_PRELOAD",
+    "form,video" if os.getenv("VIDEO_MODEL_BACKEND", "keras").lower().startswith("tflite") else "form",
+)
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach. A collection in a
+    # worker would otherwise write to every object header and un-share those pages.
+    gc.freeze()
+    server.log.info("Preloaded models: %s", os.environ.get("MODEL_PRELOAD") or "none")
+    if thread_budget:
+        server.log.info(
+            "Thread budget for %d workers: %s", workers,
+            " ".join(f"{name}={value}" for name, value in thread_budget.items()),
+        )
@@ -2,74 +2,685 @@ import cv2
 import os
 import numpy as np
 import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional, Tuple, Union
 
-_eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_eye.xml")
+from services import metrics
 
-async def detect_blur_and_save(video_path, threshold=50, max_frames=None):
+# Frames per segment handed to a worker. Each segment starts with a seek, so very
+# small segments spend most of their time decoding up to the nearest keyframe.
+FRAME_SEGMENT_SIZE = int(os.getenv("FRAME_SEGMENT_SIZE", "240"))
+
+# "sequential": decode every frame and keep the sharp ones (the reference method).
+# "seek": decode only max_frames frames spread evenly over the clip, reached with
+# a seek, so on long clips decode cost follows the frame target instead of the length.
+FRAME_SAMPLING = os.getenv("FRAME_SAMPLING", "sequential").lower()
+# Clips with fewer than this many frames per sample are decoded sequentially
+FRAME_SEEK_MIN_STRIDE = int(os.getenv("FRAME_SEEK_MIN_STRIDE", "4"))
+# A sample at most this many frames ahead is reached by grabbing; further ones by seeking,
+# which decodes from the previous keyframe. grab() still decodes every frame it passes,
+# so clips whose samples are no further apart than this are decoded sequentially too.
+FRAME_SEEK_GRAB_LIMIT = int(os.getenv("FRAME_SEEK_GRAB_LIMIT", "30"))
+# Laplacian variance shrinks or grows with the resolution it is measured at, so the
+# full-resolution threshold does not carry over. With a threshold calibrated against it
+# (scripts/calibrate_blur_threshold.py), samples are scored on a FRAME_BLUR_WIDTH-wide
+# thumbnail instead; 0 keeps the full-resolution score.
+FRAME_BLUR_THUMB_THRESHOLD = float(os.getenv("FRAME_BLUR_THUMB_THRESHOLD", "0"))
+FRAME_BLUR_WIDTH = int(os.getenv("FRAME_BLUR_WIDTH", "320"))
+# Frames tried a little further on when a sample is blurry
+FRAME_RESAMPLE_ATTEMPTS = int(os.getenv("FRAME_RESAMPLE_ATTEMPTS", "3"))
+
+# Model input: 224x224 RGB frames, stored as uint8 and scaled to [0, 1] per batch.
+FRAME_SHAPE = (224, 224, 3)
+_FRAME_BYTES = int(np.prod(FRAME_SHAPE))
+# The float32 batch iter_model_batches normalises into, at the API's VIDEO_BATCH_SIZE
+_BATCH_BUFFER_BYTES = int(os.getenv("VIDEO_BATCH_SIZE", "32")) * _FRAME_BYTES * np.dtype(np.float32).itemsize
+
+_executor: Optional[ThreadPoolExecutor] = None
+_workers = int(os.getenv("FRAME_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Threads OpenCV may use inside one call; -1 keeps its default (every core). Segments
+# already run in parallel, so multi-worker deployments set 1 (see services/cpu_budget.py).
+CV2_THREADS = int(os.getenv("CV2_THREADS", "-1"))
+if CV2_THREADS >= 0:
+    cv2.setNumThreads(CV2_THREADS)
+
+# CascadeClassifier is not safe to share between threads, so each worker gets its own.
+_local = threading.local()
+
+
+def _eye_cascade() -> cv2.CascadeClassifier:
+    cascade = getattr(_local, "eye_cascade", None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_eye.xml")
+        _local.eye_cascade = cascade
+    return cascade
+
+
+# "full": the eye cascade on every sharp frame at full resolution (the reference method).
+# "fast": the cascade on a downscaled frame every GAZE_REDETECT_EVERY sharp frames,
+# with the eye boxes followed by template matching in between.
+GAZE_DETECTOR = os.getenv("GAZE_DETECTOR", "full").lower()
+GAZE_MAX_WIDTH = int(os.getenv("GAZE_MAX_WIDTH", "480"))
+GAZE_REDETECT_EVERY = int(os.getenv("GAZE_REDETECT_EVERY", "5"))
+# Normalised cross-correlation an eye box must keep to count as still tracked
+GAZE_TRACK_THRESHOLD = float(os.getenv("GAZE_TRACK_THRESHOLD", "0.6"))
+
+# Cascade settings of the reference method, at full resolution
+_EYE_SCALE_FACTOR = 1.1
+_EYE_MIN_NEIGHBORS = 4
+_EYE_MIN_SIZE = 20
+
+
+class _FullGazeDetector:
+    def __init__(self, cascade: cv2.CascadeClassifier) -> None:
+        self.cascade = cascade
+
+    def detect(self, gray: np.ndarray) -> bool:
+        eyes = self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=_EYE_SCALE_FACTOR,
+            minNeighbors=_EYE_MIN_NEIGHBORS,
+            minSize=(_EYE_MIN_SIZE, _EYE_MIN_SIZE),
+        )
+        return len(eyes) > 0
+
+
+class _TrackingGazeDetector:
+    """Downscaled cascade every ``redetect_every`` frames, template tracking in between.
+
+    Frames must be fed in order. A frame counts as gaze if any eye box found at
+    the last detection is still matched; once every box is lost the next frame
+    runs the cascade again instead of waiting for the interval.
     """
-    Async function to detect blur and extract frames from video
-    Returns numpy array of frames for model processing
+
+    def __init__(
+        self,
+        cascade: cv2.CascadeClassifier,
+        max_width: int = GAZE_MAX_WIDTH,
+        redetect_every: int = GAZE_REDETECT_EVERY,
+        track_threshold: float = GAZE_TRACK_THRESHOLD,
+    ) -> None:
+        self.cascade = cascade
+        self.max_width = max_width
+        self.redetect_every = max(1, redetect_every)
+        self.track_threshold = track_threshold
+        self._boxes: List[List[int]] = []
+        self._templates: List[np.ndarray] = []
+        self._since_detection = 0
+        self._lost = True
+
+    def _downscale(self, gray: np.ndarray) -> Tuple[np.ndarray, float]:
+        scale = min(1.0, self.max_width / gray.shape[1]) if self.max_width else 1.0
+        if scale == 1.0:
+            return gray, scale
+        size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA), scale
+
+    def detect(self, gray: np.ndarray) -> bool:
+        small, scale = self._downscale(gray)
+        if self._lost or self._since_detection >= self.redetect_every:
+            return self._redetect(small, scale)
+        self._since_detection += 1
+        return self._track(small)
+
+    def _redetect(self, small: np.ndarray, scale: float) -> bool:
+        min_size = max(8, round(_EYE_MIN_SIZE * scale))
+        eyes = self.cascade.detectMultiScale(
+            small,
+            scaleFactor=_EYE_SCALE_FACTOR,
+            minNeighbors=_EYE_MIN_NEIGHBORS,
+            minSize=(min_size, min_size),
+        )
+        self._boxes = [list(map(int, box)) for box in eyes]
+        self._templates = [small[y:y + h, x:x + w].copy() for x, y, w, h in self._boxes]
+        self._since_detection = 1
+        # No eyes is a result too; the cascade runs again after the usual interval
+        self._lost = False
+        return bool(self._boxes)
+
+    def _track(self, small: np.ndarray) -> bool:
+        if not self._boxes:
+            return False
+        height, width = small.shape[:2]
+        boxes, templates = [], []
+        for (x, y, w, h), template in zip(self._boxes, self._templates):
+            # Search a window one box-size around the last position
+            x0, y0 = max(0, x - w), max(0, y - h)
+            x1, y1 = min(width, x + 2 * w), min(height, y + 2 * h)
+            window = small[y0:y1, x0:x1]
+            if window.shape[0] < h or window.shape[1] < w:
+                continue
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, best, _, (bx, by) = cv2.minMaxLoc(scores)
+            if best >= self.track_threshold:
+                nx, ny = x0 + bx, y0 + by
+                boxes.append([nx, ny, w, h])
+                templates.append(small[ny:ny + h, nx:nx + w].copy())
+        self._boxes, self._templates = boxes, templates
+        self._lost = not boxes
+        return bool(boxes)
+
+
+def _gaze_detector(mode: Optional[str] = None):
+    """A fresh detector for one run of consecutive frames (one segment)."""
+    mode = mode or GAZE_DETECTOR
+    if mode == "fast":
+        return _TrackingGazeDetector(_eye_cascade(), GAZE_MAX_WIDTH, GAZE_REDETECT_EVERY, GAZE_TRACK_THRESHOLD)
+    return _FullGazeDetector(_eye_cascade())
+
+
+def set_frame_workers(workers: int) -> None:
+    """Resize the decode/score pool. Takes effect for the next video processed."""
+    global _executor, _workers
+    _workers = max(1, workers)
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="frames")
+    return _executor
+
+
+class FramePool:
+    """Preallocated uint8 frame slots shared by every segment of one video.
+
+    Slots are handed out in order and never returned, so the slots in use are
+    always ``0 .. taken - 1``.
+    """
+
+    def __init__(self, capacity: int, growable: bool = False) -> None:
+        # np.empty only reserves address space; pages are committed as frames are written.
+        self.data = np.empty((max(1, capacity), *FRAME_SHAPE), dtype=np.uint8)
+        self.taken = 0
+        self.growable = growable
+
+    def take(self) -> Optional[int]:
+        """A free slot, or None when the pool is full and may not grow."""
+        if self.taken == len(self.data):
+            if not self.growable:
+                return None
+            grown = np.empty((len(self.data) * 2, *FRAME_SHAPE), dtype=np.uint8)
+            grown[:self.taken] = self.data[:self.taken]
+            self.data = grown
+        self.taken += 1
+        return self.taken - 1
+
+    def compact(self, order: List[int]) -> np.ndarray:
+        """Move slot ``order[i]`` to row i in place and return the rows in that order.
+
+        ``order`` must be a permutation of the slots in use.
+        """
+        data = self.data
+        done = [False] * len(order)
+        for start in range(len(order)):
+            if done[start] or order[start] == start:
+                continue
+            saved = data[start].copy()
+            row = start
+            while order[row] != start:
+                data[row] = data[order[row]]
+                done[row] = True
+                row = order[row]
+            data[row] = saved
+            done[row] = True
+        return data[:len(order)]
+
+
+def _to_model_input(frame: np.ndarray, out: np.ndarray) -> None:
+    # Resize for model input, then BGR (OpenCV default) to RGB (TensorFlow default), in place
+    cv2.resize(frame, FRAME_SHAPE[1::-1], dst=out)
+    cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+
+
+class _SegmentBudget:
+    """Sharp frames kept per segment, stored in one pool of at most ``max_frames`` frames."""
+
+    def __init__(self, segments: int, max_frames: Optional[int]) -> None:
+        self.kept = [0] * segments
+        self.max_frames = max_frames
+        # Each segment's result while it is still being filled, for progressive readers
+        self.results: List[Optional["_SegmentResult"]] = [None] * segments
+        # Set when the caller gave up on the video, so pool threads stop decoding it
+        self.cancelled = False
+        # However many segments run at once, frames past the max_frames cut never get a slot
+        self.pool = FramePool(max_frames or FRAME_SEGMENT_SIZE, growable=not max_frames)
+        self._lock = threading.Lock()
+
+    def exhausted_before(self, index: int) -> bool:
+        if self.cancelled:
+            return True
+        # Earlier segments come first in the merged output, so once they hold
+        # max_frames nothing from this segment survives the final cut.
+        return bool(self.max_frames) and sum(self.kept[:index]) >= self.max_frames
+
+    def keep(self, index: int, frame: np.ndarray, gaze: bool) -> bool:
+        """Store ``frame`` as segment ``index``'s next sharp frame; False if it falls past the cut."""
+        with self._lock:
+            slot = self.pool.take()
+            if slot is None:
+                slot = self._evict_after(index)
+                if slot is None:
+                    return False
+            self.pool.data[slot] = frame
+            result = self.results[index]
+            result.slots.append(slot)
+            result.gaze.append(gaze)
+            self.kept[index] += 1
+            return True
+
+    def _evict_after(self, index: int) -> Optional[int]:
+        # The pool holds max_frames frames, so the last frame of the latest later
+        # segment comes after max_frames others, the new one included: it is cut anyway.
+        for later in range(len(self.results) - 1, index, -1):
+            result = self.results[later]
+            if result is not None and result.slots:
+                result.gaze.pop()
+                self.kept[later] -= 1
+                return result.slots.pop()
+        return None
+
+    def ordered(self) -> Tuple[np.ndarray, List[bool]]:
+        """Every kept frame in video order, moved to the front of the pool, with its gaze flag."""
+        slots: List[int] = []
+        gaze_flags: List[bool] = []
+        for result in self.results:
+            if result is not None:
+                slots.extend(result.slots)
+                gaze_flags.extend(result.gaze)
+        return self.pool.compact(slots), gaze_flags
+
+
+class SharpFrames:
+    """Sharp frames from one video, kept in the buffers they were decoded into.
+
+    Frames are not copied into a new array; ``iter_model_batches`` reads across
+    the parts and normalises one batch at a time.
+    """
+
+    def __init__(self, parts: List[np.ndarray], peak_bytes: int = 0) -> None:
+        self.parts = [part for part in parts if len(part)]
+        self.peak_bytes = peak_bytes
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self.parts)
+
+    @property
+    def size(self) -> int:
+        return len(self) * _FRAME_BYTES
+
+    @property
+    def nbytes(self) -> int:
+        return sum(part.nbytes for part in self.parts)
+
+    def __array__(self, dtype=None, copy=None):
+        frames = np.concatenate(self.parts) if self.parts else np.empty((0, *FRAME_SHAPE), dtype=np.uint8)
+        return frames.astype(dtype) if dtype is not None else frames
+
+
+def iter_model_batches(frames: Union[SharpFrames, np.ndarray], batch_size: int) -> Iterator[np.ndarray]:
+    """Yield float32 batches scaled to [0, 1] for ``model.predict``.
+
+    uint8 frames are normalised into one reused buffer, so at most ``batch_size``
+    float frames exist at a time. Each yielded batch is overwritten by the next.
     """
-   
-    # Open video file
+    parts = frames.parts if isinstance(frames, SharpFrames) else [frames]
+    buffer: Optional[np.ndarray] = None
+    filled = 0
+    for part in parts:
+        if part.dtype != np.uint8:
+            # Already normalised by the caller
+            for offset in range(0, len(part), batch_size):
+                yield part[offset:offset + batch_size]
+            continue
+        if buffer is None:
+            buffer = np.empty((batch_size, *FRAME_SHAPE), dtype=np.float32)
+        offset = 0
+        while offset < len(part):
+            take = min(batch_size - filled, len(part) - offset)
+            np.divide(part[offset:offset + take], np.float32(255.0), out=buffer[filled:filled + take], dtype=np.float32)
+            filled += take
+            offset += take
+            if filled == batch_size:
+                yield buffer
+                filled = 0
+    if filled:
+        yield buffer[:filled]
+
+
+class _SegmentResult:
+    def __init__(self) -> None:
+        # Pool slots of the sharp frames kept, in video order
+        self.slots: List[int] = []
+        self.gaze: List[bool] = []
+        self.frames_read = 0
+        # Seconds spent per step, summed over this segment's frames
+        self.timings = {"decode": 0.0, "blur": 0.0, "cascade": 0.0, "resize": 0.0}
+
+
+def _process_segment(
+    video_path: str,
+    index: int,
+    start: int,
+    end: Optional[int],
+    threshold: float,
+    budget: _SegmentBudget,
+) -> _SegmentResult:
+    """Decode frames [start, end) and keep the sharp ones. Runs on a pool thread."""
+    result = _SegmentResult()
+    budget.results[index] = result
+    scratch = np.empty(FRAME_SHAPE, dtype=np.uint8)
+    gaze = _gaze_detector()
     cap = cv2.VideoCapture(video_path)
-    frame_count = 0
-    saved_count = 0
-    frames_list = []
-    gaze_detected = 0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    position = start
+    timings = result.timings
+    clock = time.perf_counter
+
+    while end is None or position < end:
+        # Stop once this segment and the ones before it hold max_frames
+        if budget.exhausted_before(index + 1):
+            break
 
-    while True:
+        started = clock()
         ret, frame = cap.read()
+        timings["decode"] += clock() - started
         if not ret:
             break
 
+        position += 1
+        result.frames_read += 1
+
+        started = clock()
         # Convert frame to grayscale for blur detection
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
         # Calculate Laplacian variance (sharpness score)
         laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        blurred = clock()
+        timings["blur"] += blurred - started
 
         if laplacian_var >= threshold:
-            saved_count += 1
-            eyes = _eye_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=4,
-                minSize=(20, 20),
-            )
-            if len(eyes) > 0:
-                gaze_detected += 1
-            # filename = os.path.join(output_dir, f"frame_{frame_count}_score_{int(laplacian_var)}.jpg")
-           # cv2.imwrite(filename, frame)
-            
-            # --- Preprocessing for the model ---
-            # 1. Resize frame for model input
-            resized_frame = cv2.resize(frame, (224, 224))
-
-            # 2. Convert color from BGR (OpenCV default) to RGB (TensorFlow default)
-            rgb_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
-
-            # 3. Rescale pixel values to 0-1 and convert to float
-            processed_frame = rgb_frame.astype('float32') / 255.0
-            
-            frames_list.append(processed_frame)
-
-        frame_count += 1
-
-        # Allow other tasks to run
-        if frame_count % 10 == 0:
-            await asyncio.sleep(0.001)
-      
-        if max_frames and saved_count >= max_frames:
+            gazed = gaze.detect(gray)
+            detected = clock()
+            timings["cascade"] += detected - blurred
+            _to_model_input(frame, scratch)
+            kept = budget.keep(index, scratch, gazed)
+            timings["resize"] += clock() - detected
+            if not kept:
+                break
+
+    cap.release()
+    return result
+
+
+def _blur_score(frame: np.ndarray, width: int) -> float:
+    """Laplacian variance of a grayscale thumbnail at most ``width`` pixels wide."""
+    height, frame_width = frame.shape[:2]
+    if frame_width > width:
+        frame = cv2.resize(frame, (width, max(1, round(height * width / frame_width))), interpolation=cv2.INTER_AREA)
+    return cv2.Laplacian(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()
+
+
+def _sample_segment(
+    video_path: str,
+    index: int,
+    positions: List[int],
+    stride: float,
+    threshold: float,
+    budget: _SegmentBudget,
+) -> _SegmentResult:
+    """Score only the frames at ``positions`` and keep the sharp ones. Runs on a pool thread.
+
+    A blurry sample is replaced by the first sharp frame among up to
+    FRAME_RESAMPLE_ATTEMPTS frames after it, all within the first half of the
+    gap to the next sample so the samples stay evenly spread.
+    """
+    result = _SegmentResult()
+    budget.results[index] = result
+    scratch = np.empty(FRAME_SHAPE, dtype=np.uint8)
+    gaze = _gaze_detector()
+    cap = cv2.VideoCapture(video_path)
+    step = max(1, int(stride / (2 * (FRAME_RESAMPLE_ATTEMPTS + 1))))
+    offsets = [k * step for k in range(FRAME_RESAMPLE_ATTEMPTS + 1) if k * step < stride]
+    # The frame the next cap.read() returns
+    position = 0
+    timings = result.timings
+    clock = time.perf_counter
+
+    for target in positions:
+        if budget.exhausted_before(index + 1):
             break
+        for offset in offsets:
+            wanted = target + offset
+            started = clock()
+            if 0 <= wanted - position <= FRAME_SEEK_GRAB_LIMIT:
+                ok = True
+                while ok and position < wanted:
+                    ok = cap.grab()
+                    position += 1
+                    result.frames_read += 1
+            else:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, wanted)
+                ok = True
+                position = wanted
+            ret, frame = cap.read() if ok else (False, None)
+            timings["decode"] += clock() - started
+            if not ret:
+                # Past the end; the container's frame count was too high
+                cap.release()
+                return result
+            position += 1
+            result.frames_read += 1
+
+            started = clock()
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if FRAME_BLUR_THUMB_THRESHOLD > 0:
+                sharp = _blur_score(frame, FRAME_BLUR_WIDTH) >= FRAME_BLUR_THUMB_THRESHOLD
+            else:
+                sharp = cv2.Laplacian(gray, cv2.CV_64F).var() >= threshold
+            blurred = clock()
+            timings["blur"] += blurred - started
+            if sharp:
+                gazed = gaze.detect(gray)
+                detected = clock()
+                timings["cascade"] += detected - blurred
+                _to_model_input(frame, scratch)
+                budget.keep(index, scratch, gazed)
+                timings["resize"] += clock() - detected
+                break
 
     cap.release()
-    print(f"✅ Done! Saved {saved_count} sharp frames out of {frame_count} total frames.")
-    
+    return result
+
+
+def _frame_count(video_path: str) -> int:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    finally:
+        cap.release()
+
+
+class _Segment(NamedTuple):
+    """Frames [start, end) decoded in full, or only ``positions``, spaced ``stride`` apart."""
+    start: int
+    end: Optional[int]
+    positions: Optional[List[int]] = None
+    stride: float = 0.0
+
+
+def _segment_bounds(total: int, max_frames: Optional[int] = None) -> List[_Segment]:
+    # With samples within grab range every frame up to the last one is decoded anyway,
+    # while the sequential method stops as soon as it has max_frames sharp frames
+    min_stride = max(FRAME_SEEK_MIN_STRIDE, FRAME_SEEK_GRAB_LIMIT + 1)
+    if FRAME_SAMPLING == "seek" and max_frames and total >= max_frames * min_stride:
+        stride = total / max_frames
+        positions = [int((i + 0.5) * stride) for i in range(max_frames)]
+        size = -(-len(positions) // _workers)
+        return [
+            _Segment(positions[i], None, positions[i:i + size], stride) for i in range(0, len(positions), size)
+        ]
+    # The last segment always reads to the end, in case the container's frame count is off.
+    bounds = [_Segment(start, start + FRAME_SEGMENT_SIZE) for start in range(0, total, FRAME_SEGMENT_SIZE)] or [_Segment(0, None)]
+    bounds[-1] = bounds[-1]._replace(end=None)
+    return bounds
+
+
+async def _plan_segments(video_path: str, max_frames: Optional[int]) -> List[_Segment]:
+    total = await asyncio.get_running_loop().run_in_executor(_get_executor(), _frame_count, video_path)
+    return _segment_bounds(total, max_frames)
+
+
+def _submit_segment(
+    video_path: str,
+    index: int,
+    segment: _Segment,
+    threshold: float,
+    budget: _SegmentBudget,
+) -> asyncio.Future:
+    loop = asyncio.get_running_loop()
+    if segment.positions is not None:
+        return loop.run_in_executor(
+            _get_executor(), _sample_segment, video_path, index, segment.positions, segment.stride, threshold, budget
+        )
+    return loop.run_in_executor(
+        _get_executor(), _process_segment, video_path, index, segment.start, segment.end, threshold, budget
+    )
+
+
+def _record_extraction(results: List[Optional[_SegmentResult]], saved_count: int, note: str) -> None:
+    frame_count = 0
+    timings = dict.fromkeys(("decode", "blur", "cascade", "resize"), 0.0)
+    for result in results:
+        if result is None:
+            continue
+        frame_count += result.frames_read
+        for step, seconds in result.timings.items():
+            timings[step] += seconds
+    for step, seconds in timings.items():
+        metrics.observe_stage(step, seconds)
+    metrics.frames_read.inc(frame_count)
+    metrics.frames_kept.inc(saved_count)
+    print(f"✅ Done! Saved {saved_count} sharp frames out of {frame_count} total frames {note}.")
+
+
+async def detect_blur_and_save(video_path, threshold=50, max_frames=None):
+    """
+    Async function to detect blur and extract frames from video
+    Returns the sharp frames as uint8 ``SharpFrames`` and the eye gaze percentage
+
+    Decoding and scoring run on a thread pool. The video is split into segments of
+    FRAME_SEGMENT_SIZE frames, up to FRAME_WORKERS of them decoded in parallel,
+    and the results are merged back in frame order.
+
+    With FRAME_SAMPLING=seek and ``max_frames`` set, clips long enough for the
+    samples to be reached by seeking have only about ``max_frames`` frames spread
+    evenly over them scored instead, split between the workers.
+    """
+    bounds = await _plan_segments(video_path, max_frames)
+    budget = _SegmentBudget(len(bounds), max_frames)
+    results: List[Optional[_SegmentResult]] = [None] * len(bounds)
+    pending = {}
+    next_segment = 0
+
+    try:
+        while next_segment < len(bounds) or pending:
+            while next_segment < len(bounds) and len(pending) < _workers and not budget.exhausted_before(next_segment):
+                future = _submit_segment(video_path, next_segment, bounds[next_segment], threshold, budget)
+                pending[future] = next_segment
+                next_segment += 1
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+    except asyncio.CancelledError:
+        budget.cancelled = True
+        raise
+
+    kept, gaze_flags = budget.ordered()
+    # The shared frame pool, plus one float32 batch during inference
+    peak_bytes = budget.pool.data.nbytes + _BATCH_BUFFER_BYTES
+    frames = SharpFrames([kept], peak_bytes=peak_bytes)
+    saved_count = len(frames)
+    gaze_detected = sum(gaze_flags)
+    _record_extraction(results, saved_count, f"(peak frame memory {peak_bytes / (1024 * 1024):.1f} MB)")
+
     gaze_percentage = (gaze_detected / saved_count) * 100 if saved_count else 0.0
-    if frames_list:
-        # The shape will be (num_frames, 224, 224, 3), which is what model.predict expects
-        frames_array = np.array(frames_list)
-        return frames_array, gaze_percentage
-    else:
-        return np.array([]), 0.0  # Return empty array if no frames found
+    # Frames are uint8 RGB of shape (num_frames, 224, 224, 3); iter_model_batches scales them for the model
+    return frames, gaze_percentage
+
+
+async def iter_sharp_frames(
+    video_path,
+    threshold=50,
+    max_frames=None,
+    poll_seconds: float = 0.01,
+) -> AsyncIterator[Tuple[np.ndarray, List[bool]]]:
+    """Yield sharp frames in video order while the rest of the video is still decoding.
+
+    Uses the same segments, pool and frame selection as ``detect_blur_and_save``.
+    Each item is (uint8 frames, eye-gaze flag per frame) for the frames that became
+    available since the last one. Closing the generator early stops the decode.
+    """
+    bounds = await _plan_segments(video_path, max_frames)
+    budget = _SegmentBudget(len(bounds), max_frames)
+    pending = {}
+    finished = set()
+    next_segment = 0
+    current = 0
+    consumed = 0
+    emitted = 0
+
+    try:
+        while current < len(bounds) and not (max_frames and emitted >= max_frames):
+            while next_segment < len(bounds) and len(pending) < _workers and not budget.exhausted_before(next_segment):
+                future = _submit_segment(video_path, next_segment, bounds[next_segment], threshold, budget)
+                pending[future] = next_segment
+                next_segment += 1
+
+            result = budget.results[current]
+            if result is not None:
+                # Size first: frames below it are fully written, even if the pool grows meanwhile.
+                # Running segments only ever take slots from segments after themselves.
+                size = len(result.slots)
+                data = budget.pool.data
+                if max_frames:
+                    size = min(size, consumed + max_frames - emitted)
+                if size > consumed:
+                    # A copy, as a later segment's slots may be handed to an earlier one
+                    frames, flags = data[result.slots[consumed:size]], result.gaze[consumed:size]
+                    consumed = size
+                    emitted += len(frames)
+                    yield frames, flags
+                    continue
+            if current in finished:
+                current += 1
+                consumed = 0
+                continue
+            if current >= next_segment:
+                # Not started because earlier segments already hold max_frames
+                break
+            done, _ = await asyncio.wait(pending, timeout=poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                finished.add(pending.pop(future))
+                future.result()
+    finally:
+        # Segments still running stop at their next frame
+        budget.cancelled = True
+        for future in pending:
+            future.add_done_callback(_ignore_result)
+        _record_extraction(budget.results, emitted, "(progressive)")
+
+
+def _ignore_result(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
@@ -1,25 +1,141 @@
+import asyncio
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 import models
-from database import engine
-from routers import auth, data, predictions, notifications
+from database import add_missing_columns, create_missing_indexes, engine, pool_stats
+from routers import admin, auth, data, predictions, notifications
+from services.uploads import UploadLimitMiddleware
+from services.admission import AdmissionMiddleware, limiter_from_env
+from services import metrics, reporting
+from services.model_registry import model_registry
+from services.notifications import notification_manager
 
 # Load environment variables first
 load_dotenv()
 
-app = FastAPI(title="Cognicare API", description="Autism Detection API")
+# Load and warm the models at start-up instead of on the first prediction
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+# GET /debug/profile is only served when this token is set, and must be sent as X-Profiler-Token
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+# Models loaded when this module is imported, e.g. "form,video". Under gunicorn with
+# preload_app (see gunicorn.conf.py) that happens once in the master, and the forked
+# workers share the weight pages copy-on-write instead of each loading a copy.
+MODEL_PRELOAD = [name.strip() for name in os.getenv("MODEL_PRELOAD", "").split(",") if name.strip()]
 
-# Create the database tables
-models.Base.metadata.create_all(bind=engine)
+if "video" in MODEL_PRELOAD and predictions.VIDEO_MODEL_BACKEND in ("keras", "xla"):
+    # The TensorFlow runtime does not survive a fork; TFLite artefacts are safe to share
+    print("⚠️ Not preloading the video model: the keras/xla backends must load in each worker")
+    MODEL_PRELOAD.remove("video")
+model_registry.preload(MODEL_PRELOAD)
+
+loop_monitor = metrics.EventLoopMonitor()
+metrics.instrument_engine(engine.sync_engine)
+metrics.registry.gauge("cognicare_event_loop_lag_last_seconds", "Most recent event-loop lag sample", lambda: loop_monitor.last_lag)
+metrics.registry.gauge("cognicare_websocket_connections", "Open notification sockets on this worker", notification_manager.connection_counts, "kind")
+metrics.registry.gauge(
+    "cognicare_db_pool",
+    "Database connection pool state",
+    lambda: {key: value for key, value in pool_stats().items() if isinstance(value, (int, float))},
+    "state",
+)
+metrics.registry.gauge(
+    "cognicare_video_scheduler",
+    "Video batching scheduler state",
+    lambda: {key: value for key, value in predictions.video_scheduler.metrics().items() if isinstance(value, (int, float))},
+    "field",
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the database tables
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns, models.Base.metadata)
+        await conn.run_sync(create_missing_indexes, models.Base.metadata)
+    # Background workers for /predict/combined?mode=async
+    await predictions.job_workers.start()
+    # Subscribe to notifications published by any worker
+    await notification_manager.start()
+    await loop_monitor.start()
+    # Pick up new model versions (CURRENT pointer or replaced files) without a restart
+    await model_registry.start()
+    # Warm up in the background so the app accepts requests straight away
+    warm_up = None
+    if MODEL_WARMUP:
+        warm_up = asyncio.create_task(predictions.warm_up_models())
+    try:
+        yield
+    finally:
+        if warm_up is not None:
+            warm_up.cancel()
+        await predictions.job_workers.stop()
+        await model_registry.stop()
+        await notification_manager.stop()
+        await loop_monitor.stop()
+        await reporting.aclose()
+        await engine.dispose()
+
+app = FastAPI(title="Cognicare API", description="Autism Detection API", lifespan=lifespan)
+
+# Reject oversized video uploads while they are still streaming in
+app.add_middleware(UploadLimitMiddleware, paths=["/predict/combined"])
+# Bound concurrent heavy requests per worker; the excess waits briefly or gets 503/429
+app.add_middleware(
+    AdmissionMiddleware,
+    limiters={
+        ("POST", "/predict/combined"): limiter_from_env("predict_combined", "PREDICT", concurrency=4, queue_size=16, max_wait_seconds=30),
+        ("POST", "/predict/forms/batch"): limiter_from_env("forms_batch", "FORMS_BATCH", concurrency=2, queue_size=8, max_wait_seconds=10),
+    },
+    identify=auth.email_from_scope,
+)
+# Request latency histograms and optional per-request trace logs
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(data.router)
 app.include_router(predictions.router)
 app.include_router(notifications.router)
+app.include_router(admin.router)
 
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 503 until both models are loaded and warmed up"""
+    statuses = predictions.model_status
+    ready = not MODEL_WARMUP or all(state == "ready" for state in statuses.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", "models": statuses},
+    )
+
+@app.get("/health/db")
+def database_pool_stats():
+    """Connection pool utilisation of this worker"""
+    return pool_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text-format metrics of this worker"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def sampling_profile(
+    seconds: float = Query(10.0, gt=0, le=120),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    x_profiler_token: str = Header(None),
+):
+    """Sample every thread's stack for a while; returns collapsed stacks for flamegraph tools"""
+    if not PROFILER_TOKEN or x_profiler_token != PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    stacks = await asyncio.to_thread(metrics.profiler.run, seconds, interval_ms / 1000)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(stacks)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -23,6 +23,59 @@ class Data(Base):
     form_confidence = Column(Float, nullable=True)
     eye_gaze_percentage = Column(Float, nullable=True)
     report_text = Column(Text, nullable=True)
+    report_source = Column(String, nullable=True)
+    report_cache_key = Column(String, nullable=True)
+    # Registry versions that produced this row's predictions
+    video_model_version = Column(String, nullable=True)
+    form_model_version = Column(String, nullable=True)
+    # Sharp frames the video prediction was based on; fewer than extracted when it stopped early
+    video_frames_used = Column(Integer, nullable=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
-    user = relationship("User", back_populates="data")
\ No newline at end of file
+    user = relationship("User", back_populates="data")
+
+    __table_args__ = (
+        # Serves /data/history: one user's rows, newest first, paged by (timestamp, id)
+        Index("ix_data_user_email_timestamp_id", "user_email", "timestamp", "id"),
+    )
+
+class PredictionJob(Base):
+    __tablename__ = "prediction_jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    user_email = Column(String, ForeignKey("users.email"), index=True)
+    status = Column(String, index=True, default="queued")
+    form_input = Column(Text)
+    video_path = Column(String, nullable=True)
+    video_hash = Column(String, nullable=True)
+    data_id = Column(Integer, ForeignKey("data.id"), nullable=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ReportCache(Base):
+    __tablename__ = "report_cache"
+
+    key = Column(String, primary_key=True, index=True)
+    prompt = Column(Text)
+    report_text = Column(Text)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True))
+    last_used_at = Column(DateTime(timezone=True), index=True)
+    expires_at = Column(DateTime(timezone=True), index=True)
+
+class VideoResult(Base):
+    """Video-stage output per upload content, so a re-submitted clip skips decoding and inference."""
+    __tablename__ = "video_results"
+
+    content_hash = Column(String, primary_key=True)
+    model_version = Column(String, primary_key=True)
+    video_prediction = Column(String)
+    video_confidence = Column(Float)
+    eye_gaze_percentage = Column(Float)
+    frames_used = Column(Integer, nullable=True)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), nullable=True)
@@ -1,10 +1,16 @@
-import pandas as pd
+import asyncio
+import numpy as np
 from pydantic import BaseModel, Field
 from fastapi import APIRouter, HTTPException
-from typing import List
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from pathlib import Path
-import main
 import joblib
+import hashlib
+import os
+
+from services import metrics
+from services.caching import LayeredCache, SQLiteCache, TTLCache
+from services.model_registry import ModelSlot, model_registry
 
 
 router = APIRouter(
@@ -12,19 +18,167 @@ router = APIRouter(
    tags=["Forms"]
 )
 
-# --- model caching and robust path resolution ---
-_model = None
+class QuestionnaireInput(BaseModel):
+    A1: int
+    A2: int
+    A3: int
+    A4: int
+    A5: int
+    A6: int
+    A7: int
+    A8: int
+    A9: int
+    A10: int
+    Age_Mons: int
+    Sex: str
+    Ethnicity: str
+    Jaundice: str
+    Family_mem_with_ASD: str
+
+class QuestionnaireBatch(BaseModel):
+    questionnaires: List[QuestionnaireInput] = Field(..., min_length=1)
+
+class _FeatureEncoder:
+    """Maps questionnaire answers to column positions of the model's feature matrix.
+
+    Numeric answers land in the column of the same name; categorical answers set the
+    one-hot column ``<feature>_<value>``. Unknown categories leave every column of
+    that feature at 0, as before.
+    """
+
+    def __init__(self, columns) -> None:
+        self.width = len(columns)
+        self.index: Dict[str, int] = {str(name): i for i, name in enumerate(columns)}
+
+    def encode_into(self, row: np.ndarray, input_data: dict) -> None:
+        for feature, value in input_data.items():
+            position = self.index.get(feature)
+            if position is None:
+                position = self.index.get(f"{feature}_{value}")
+                if position is None:
+                    continue
+                value = 1
+            row[position] = value
+
+    def encode(self, rows: List[dict]) -> np.ndarray:
+        matrix = np.zeros((len(rows), self.width), dtype=np.float64)
+        for i, input_data in enumerate(rows):
+            self.encode_into(matrix[i], input_data)
+        return matrix
+
+# --- model registry and robust path resolution ---
+# Resolve project root reliably from this file's location
+_MODEL_PATH = Path(
+    os.getenv("FORM_MODEL_PATH") or Path(__file__).resolve().parents[2] / "ml_models" / "asd_rf_model.pkl"  # Cognicare-Backend
+)
+
+# Overrides the forest's n_jobs from training; 0 keeps it (see services/cpu_budget.py)
+_MODEL_JOBS = int(os.getenv("FORM_MODEL_JOBS", "0"))
+
+class _FormModel(NamedTuple):
+    model: object
+    encoder: _FeatureEncoder
+
+# The model is deterministic, so identical encoded answers always give the same result.
+# FORM_CACHE_BACKEND=sqlite adds a host-local cache file shared by all workers.
+_prediction_cache = LayeredCache(
+    TTLCache(
+        max_entries=int(os.getenv("FORM_CACHE_SIZE", "10000")),
+        ttl_seconds=float(os.getenv("FORM_CACHE_TTL_SECONDS", "86400")),
+    ),
+    SQLiteCache(
+        os.getenv("FORM_CACHE_PATH", "/tmp/cognicare/form_cache.sqlite3"),
+        ttl_seconds=float(os.getenv("FORM_CACHE_TTL_SECONDS", "86400")),
+    ) if os.getenv("FORM_CACHE_BACKEND", "memory").lower() == "sqlite" else None,
+)
+
+def _load_form_model(path: Path) -> _FormModel:
+    model = joblib.load(path)
+    # Try to get feature names from the model
+    if not hasattr(model, 'feature_names_in_'):
+        raise HTTPException(status_code=500, detail="Model is missing feature names information.")
+    if _MODEL_JOBS and hasattr(model, "n_jobs"):
+        # n_jobs=-1 from training would start a thread per core for every prediction
+        model.n_jobs = _MODEL_JOBS
+    encoder = _FeatureEncoder(model.feature_names_in_)
+    if len(encoder.index) != model.n_features_in_:
+        raise HTTPException(status_code=500, detail="Model feature names are not unique.")
+    # The encoder fills columns in the fitted order, so the model gets a bare ndarray.
+    # Dropping the names it was fitted with skips sklearn's per-call name check and warning.
+    del model.feature_names_in_
+    return _FormModel(model, encoder)
+
+def _warm_up_form_model(form_model: _FormModel) -> None:
+    _score(form_model, form_model.encoder.encode([{f"A{i}": 0 for i in range(1, 11)}]))
+
+# Versions live in ml_models/form/<version>/asd_rf_model.pkl; without that directory
+# FORM_MODEL_PATH is served and reloaded whenever the file changes
+form_models = model_registry.register(
+    ModelSlot("form", _MODEL_PATH.name, _MODEL_PATH, _load_form_model, warm_up=_warm_up_form_model)
+)
+
+def form_cache_stats() -> dict:
+    """Hit/miss counters of the form prediction cache."""
+    loaded = form_models.peek()
+    return {"model_version": loaded.version if loaded else None, **_prediction_cache.stats()}
+
+def _cache_lookups() -> dict:
+    stats = _prediction_cache.stats()
+    return {"hit": stats["hits"], "miss": stats["misses"]}
+
+metrics.registry.gauge(
+    "cognicare_form_cache_lookups", "Form prediction cache lookups since start, by result", _cache_lookups, "result",
+)
+
+async def _cache_call(method, *args):
+    if _prediction_cache.shared is None:
+        return method(*args)
+    # The shared layer is a SQLite file that another worker may hold locked for up to a second
+    return await asyncio.to_thread(method, *args)
+
+def _score(form_model: _FormModel, matrix: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Run the forest once over ``matrix``; returns (predictions, probability of ASD)."""
+    saved_model = form_model.model
+    with metrics.timed("form_model"):
+        if hasattr(saved_model, "predict_proba"):
+            # predict() is argmax over predict_proba(), so one pass gives both
+            proba = saved_model.predict_proba(matrix)
+            preds = saved_model.classes_.take(np.argmax(proba, axis=1))
+            return preds, proba[:, 1]
+        return saved_model.predict(matrix), None
+
+def predict_autism_batch(rows: List[dict]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Score many questionnaires in one vectorised model call.
+
+    Returns:
+        tuple: (predictions (0 or 1) per row, probability of ASD per row or None)
+    """
+    form_model = form_models.get().model
+    return _score(form_model, form_model.encoder.encode(rows))
+
+async def predict_autism_versioned(input_data: dict) -> Tuple[int, Optional[float], str]:
+    """``predict_autism`` plus the version of the form model that scored the answers."""
+    # One reference for the whole call, so a hot-swap cannot mix versions. Loading
+    # (first use, before warm-up finishes) reads the file, so it runs off the event loop.
+    loaded = form_models.peek() or await asyncio.to_thread(form_models.get)
+    form_model = loaded.model
+
+    row = np.zeros((1, form_model.encoder.width), dtype=np.float64)
+    form_model.encoder.encode_into(row[0], input_data)
+
+    # The encoded row is the canonical form of the answers
+    cache_key = f"{loaded.version}:{hashlib.blake2b(row.tobytes(), digest_size=16).hexdigest()}"
+    cached = await _cache_call(_prediction_cache.get, cache_key)
+    if cached is not None:
+        return cached[0], cached[1], loaded.version
 
-def _load_model():
-    global _model
-    if _model is None:
-        # Resolve project root reliably from this file's location
-        project_root = Path(__file__).resolve().parents[2]  # Cognicare-Backend
-        model_path = project_root / "ml_models" / "asd_rf_model.pkl"
-        if not model_path.exists():
-            raise HTTPException(status_code=500, detail=f"Model file not found at: {model_path}")
-        _model = joblib.load(model_path)
-    return _model
+    # Make prediction
+    preds, probs = _score(form_model, row)
+    pred = int(preds[0])
+    prob = float(probs[0]) if probs is not None else None
+
+    await _cache_call(_prediction_cache.set, cache_key, [pred, prob])
+    return pred, prob, loaded.version
 
 async def predict_autism(input_data):
     """Predict autism likelihood using the saved model.
@@ -41,34 +195,5 @@ async def predict_autism(input_data):
     Returns:
         tuple: (prediction (0 or 1), probability of ASD)
     """
-    # Load the saved model (cached)
-    saved_model = _load_model()
-
-    # Try to get feature names from the model
-    if not hasattr(saved_model, 'feature_names_in_'):
-        raise HTTPException(status_code=500, detail="Model is missing feature names information.")
-    
-    columns = saved_model.feature_names_in_
-    
-    # Create a DataFrame with one row (all zeros)
-    test_data = pd.DataFrame([{col: 0 for col in columns}])
-    
-    # Update with provided values
-    for feature, value in input_data.items():
-        if feature in test_data.columns:
-            test_data[feature] = value
-        else:
-            # Handle categorical features
-            col_name = f"{feature}_{value}"
-            if col_name in test_data.columns:
-                # Reset all related columns
-                related_cols = [c for c in test_data.columns if c.startswith(f"{feature}_")]
-                for c in related_cols:
-                    test_data[c] = 0
-                test_data[col_name] = 1
-    
-    # Make prediction
-    pred = saved_model.predict(test_data)[0]
-    prob = saved_model.predict_proba(test_data)[0][1] if hasattr(saved_model, "predict_proba") else None
-    
-    return int(pred), prob
\ No newline at end of file
+    pred, prob, _ = await predict_autism_versioned(input_data)
+    return pred, prob
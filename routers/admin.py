@@ -0,0 +1,49 @@
+import asyncio
+import os
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+from services.model_registry import model_registry
+
+# /admin is only served when this token is set, and must be sent as X-Admin-Token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin_token(x_admin_token: str = Header(None)) -> None:
+    if not ADMIN_TOKEN or not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(require_admin_token)],
+)
+
+
+def _slot_state(name: str, swapped: bool) -> dict:
+    loaded = model_registry.slot(name).peek()
+    return {"model": name, "active": loaded.version if loaded else None, "swapped": swapped}
+
+
+@router.get("/models")
+def list_models():
+    """Active and available versions of every model on this worker"""
+    return model_registry.describe()
+
+
+@router.post("/models/{name}/reload")
+async def reload_model(name: str):
+    """Swap to the active version now instead of at the next file check"""
+    slot = model_registry.slot(name)
+    swapped = await asyncio.to_thread(slot.refresh)
+    return _slot_state(name, swapped)
+
+
+@router.post("/models/{name}/activate")
+async def activate_model(name: str, version: str = Query(..., min_length=1)):
+    """Make ``version`` the active one; other workers follow within MODEL_WATCH_SECONDS"""
+    slot = model_registry.slot(name)
+    swapped = await asyncio.to_thread(slot.activate, version)
+    return _slot_state(name, swapped)
@@ -1,16 +1,21 @@
 import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import Annotated
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, Optional
 from pydantic import BaseModel, EmailStr
 from starlette import status
 from models import User
-from database import SessionLocal
+from database import db_dependency
 from passlib.context import CryptContext 
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from services.caching import TTLCache
 
 MAX_PASSWORD_BYTES = 72
 load_dotenv()
@@ -28,6 +33,19 @@ algorithm = os.getenv("ALGORITHM")
 if not secret_key or not algorithm:
     raise RuntimeError("SECRET_KEY and ALGORITHM must be set in environment variables.")
 
+# bcrypt costs tens of milliseconds of CPU per call; a small dedicated pool keeps login
+# bursts off the event loop without letting them take every core
+_hash_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AUTH_HASH_WORKERS", "2")),
+    thread_name_prefix="bcrypt",
+)
+
+# Claims of recently verified tokens, each kept no longer than the token's own exp
+_token_cache = TTLCache(
+    max_entries=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300")),
+)
+
 class CreateUserRequest(BaseModel):
     username: str
     email: EmailStr
@@ -37,41 +55,32 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-def get_db():
-    db = SessionLocal()
-    try: 
-        yield db
-    finally:
-        db.close()
-
-db_dependency = Annotated[Session, Depends(get_db)]
-
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_user(user: CreateUserRequest, db: db_dependency):
+async def create_user(user: CreateUserRequest, db: db_dependency):
     if len(user.password.encode("utf-8")) > MAX_PASSWORD_BYTES:
         raise HTTPException(status_code=400, detail="Password must be 72 bytes or fewer")
     
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = (await db.execute(select(User).where(User.email == user.email))).scalar_one_or_none()
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
 
     new_user = User(
         username=user.username,
         email=user.email,
-        hashed_password=bcrypt_context.hash(user.password)
+        hashed_password=await hash_password(user.password)
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     token = create_access_token(new_user.email, new_user.email)
     return {"access_token": token, "token_type": "bearer"}
 
-def authenticate_user(email: str, password: str, db: Session):
+async def authenticate_user(email: str, password: str, db: AsyncSession):
     if len(password.encode("utf-8")) > MAX_PASSWORD_BYTES:
         raise HTTPException(status_code=400, detail="Invalid credentials")
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not bcrypt_context.verify(password, user.hashed_password):
+    user = (await db.execute(select(User).where(User.email == email))).scalar_one_or_none()
+    if not user or not await verify_password(password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Invalid credentials")
     return user
 
@@ -81,25 +90,54 @@ def create_access_token(email: str, user_email: str, expires_delta: timedelta =
     encode.update({"exp": expires}) 
     return jwt.encode(encode, secret_key, algorithm=algorithm)
 
-def get_current_user(token: str = Depends(OAuth2_Bearer)):
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, bcrypt_context.hash, password)
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, bcrypt_context.verify, password, hashed_password
+    )
+
+async def get_current_user(token: str = Depends(OAuth2_Bearer)):
+    cached = _token_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, secret_key, algorithms=[algorithm])
         email: str = payload.get("sub")
         user_email: str = payload.get("email")
         if email is None or user_email is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        return {"email": email, "user_email": user_email}
+        user = {"email": email, "user_email": user_email}
+        expires = payload.get("exp")
+        if expires is not None:
+            _token_cache.set(token, user, ttl_seconds=float(expires) - time.time())
+        return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+async def email_from_scope(scope) -> Optional[str]:
+    """The verified email behind an ASGI request's bearer token, or None; for middlewares."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return (await get_current_user(token))["email"]
+            except HTTPException:
+                # The endpoint itself answers 401
+                return None
+    return None
+
 @router.get("/")
-def get_users(db: db_dependency):
-    users = db.query(User).all()
+async def get_users(db: db_dependency):
+    users = (await db.execute(select(User))).scalars().all()
     return users
 
 @router.post("/token", response_model=Token)
 async def get_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: db_dependency):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     token = create_access_token(user.email, user.email, timedelta(minutes=15))
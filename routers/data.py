@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from typing import Annotated, List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import and_, case, select, tuple_
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 import models
-from database import SessionLocal
+from database import db_dependency
 from .auth import get_current_user
 
 router = APIRouter(
@@ -12,15 +12,6 @@ router = APIRouter(
     tags=["data"],
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-db_dependency = Annotated[Session, Depends(get_db)]
-
 class PredictionHistoryItem(BaseModel):
     id: int
     prediction_type: str
@@ -29,47 +20,87 @@ class PredictionHistoryItem(BaseModel):
     form_prediction: str | None
     form_confidence: float | None
     eye_gaze_percentage: float | None
-    report_text: str | None
+    report_text: str | None = None
     overall: float | None
     timestamp: datetime
 
     class Config:
         from_attributes = True
 
+_has_video = models.Data.video_prediction.isnot(None)
+_has_form = models.Data.form_prediction.isnot(None)
+
+_prediction_type = case(
+    (and_(_has_video, _has_form), "combined"),
+    (_has_video, "video"),
+    else_="form",
+).label("prediction_type")
+
+# NULL confidences propagate to a NULL overall score instead of failing the request
+_overall = case(
+    (
+        and_(_has_video, _has_form),
+        (models.Data.form_confidence * 100 + models.Data.video_confidence + models.Data.eye_gaze_percentage) / 2,
+    ),
+    (_has_video, models.Data.video_confidence * 100),
+    (_has_form, models.Data.form_confidence * 100),
+    else_=None,
+).label("overall")
+
+_history_columns = [
+    models.Data.id,
+    _prediction_type,
+    models.Data.video_prediction,
+    models.Data.video_confidence,
+    models.Data.form_prediction,
+    models.Data.form_confidence,
+    models.Data.eye_gaze_percentage,
+    _overall,
+    models.Data.timestamp,
+]
+
 @router.get("/history", response_model=List[PredictionHistoryItem])
 async def get_prediction_history(
+    response: Response,
     current_user: dict = Depends(get_current_user),
-    db: db_dependency = None
+    db: db_dependency = None,
+    limit: int = Query(50, ge=1, le=200, description="Maximum number of records to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    include_report: bool = Query(True, description="Set to false to leave out report_text"),
 ):
-    """Get all prediction history for the authenticated user"""
-    records = (
-        db.query(models.Data)
-        .filter(models.Data.user_email == current_user['email'])
-        .order_by(models.Data.timestamp.desc())
-        .all()
-    )
+    """Get prediction history for the authenticated user, newest first.
 
-    history: List[PredictionHistoryItem] = []
-    for item in records:
-        has_video = item.video_prediction is not None
-        has_form = item.form_prediction is not None
-        prediction_type = "combined" if has_video and has_form else ("video" if has_video else "form")
-        predicted_class = item.video_prediction if has_video else item.form_prediction
-        confidence = item.video_confidence if has_video else item.form_confidence
+    Pages are keyset-paginated on (timestamp, id); when more records exist the
+    response carries an ``X-Next-Cursor`` header to pass back as ``cursor``.
+    """
+    columns = (_history_columns + [models.Data.report_text]) if include_report else _history_columns
+    query = (
+        select(*columns)
+        .where(models.Data.user_email == current_user['email'])
+        .order_by(models.Data.timestamp.desc(), models.Data.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        cursor_id = _decode_cursor(cursor)
+        # Compare against the stored timestamp of the cursor row so the database's own
+        # datetime representation is used on both sides
+        cursor_timestamp = (
+            select(models.Data.timestamp)
+            .where(models.Data.id == cursor_id, models.Data.user_email == current_user['email'])
+            .scalar_subquery()
+        )
+        query = query.where(
+            tuple_(models.Data.timestamp, models.Data.id) < tuple_(cursor_timestamp, cursor_id)
+        )
 
-        history.append(
-            PredictionHistoryItem(
-                id=item.id,
-                prediction_type=prediction_type,
-                video_prediction=item.video_prediction,
-                video_confidence=item.video_confidence,
-                form_prediction=item.form_prediction,
-                form_confidence=item.form_confidence,
-                eye_gaze_percentage=item.eye_gaze_percentage,
-                report_text=item.report_text,
-                overall=(item.form_confidence*100+item.video_confidence+item.eye_gaze_percentage)/2 if has_video and has_form else (item.video_confidence*100 if has_video else (item.form_confidence*100 if has_form else None)),
-                timestamp=item.timestamp,
+    rows = (await db.execute(query)).mappings().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    return rows
 
-            )
-        )
-    return history
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -1,17 +1,48 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Query, status
 
 from services.notifications import notification_manager
+from .auth import get_current_user
 
 router = APIRouter()
 
+# Browsers cannot set headers on a WebSocket, so the token may come as the
+# subprotocol pair ("bearer", <token>) instead of the ``token`` query parameter
+_TOKEN_SUBPROTOCOL = "bearer"
+
+def _subprotocol_token(websocket: WebSocket) -> Optional[str]:
+    protocols = [value.strip() for value in websocket.headers.get("sec-websocket-protocol", "").split(",")]
+    if len(protocols) == 2 and protocols[0] == _TOKEN_SUBPROTOCOL and protocols[1]:
+        return protocols[1]
+    return None
+
 @router.websocket("/ws/notifications")
 async def websocket_notifications(
     websocket: WebSocket,
-    email: str = Query(..., description="Authenticated user email"),
+    token: Optional[str] = Query(None, description="JWT access token, if not sent as a subprotocol"),
+    last_event_id: Optional[int] = Query(None, description="Replay buffered events newer than this id"),
 ):
-    await notification_manager.connect(email, websocket)
+    subprotocol_token = _subprotocol_token(websocket)
+    token = subprotocol_token or token
+    try:
+        if not token:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        email = (await get_current_user(token))["email"]
+    except HTTPException:
+        # Before accept() and before any replay, so nothing is sent to an unauthenticated client
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    subscriber = await notification_manager.connect(
+        email, websocket, last_event_id,
+        subprotocol=_TOKEN_SUBPROTOCOL if subprotocol_token else None,
+    )
     try:
         while True:
             await websocket.receive_text()
-    except WebSocketDisconnect:
-        notification_manager.disconnect(email, websocket)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was closed server-side (slow or dead client)
+        pass
+    finally:
+        notification_manager.disconnect(email, subscriber)
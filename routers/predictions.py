@@ -1,20 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, File, Form, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, Form, Query, UploadFile
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import tensorflow as tf
 import numpy as np
-from typing import List, Annotated, Optional
-from sqlalchemy.orm import Session
+from typing import List, Literal, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 import asyncio
-import tempfile
+import json
+import time
+from pathlib import Path
 
 from .auth import get_current_user
-from database import SessionLocal
+from database import db_dependency
 import models
-from image import detect_blur_and_save
-from .Mlpredict.form import predict_autism
+import image
+from image import detect_blur_and_save, iter_model_batches, iter_sharp_frames
+from .Mlpredict.form import form_models, predict_autism_batch, predict_autism_versioned, QuestionnaireBatch
 from services.reporting import generate_and_store_report
 from services.notifications import notification_manager
+from services.uploads import SpooledUpload
+from services import metrics
+from services import early_exit
+from services.inference import BatchingScheduler
+from services.model_registry import LoadedModel, ModelSlot, model_registry
+from services.jobs import JOB_STORAGE_DIR, JobWorkerPool, enqueue_job
+from services.video_backends import VIDEO_MODEL_BACKEND, artefact_path, load_video_backend
+from services.video_results import get_video_result, store_video_result
 
 router = APIRouter(
     prefix="/predict",
@@ -26,28 +37,78 @@ class PredictionInput(BaseModel):
     # This type definition matches the shape (num_frames, 224, 224, 3)
     frames: List[List[List[List[float]]]]
 
-# Load model once at module level
-_model = None
+# Questionnaires accepted by one /predict/forms/batch call
+MAX_FORM_BATCH = int(os.getenv("MAX_FORM_BATCH", "10000"))
+
+# Frames normalised and sent to the model at a time
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", "32"))
+
+VIDEO_MODEL_PATH = os.getenv("VIDEO_MODEL_PATH", "ml_models/best_model_fine_tuned.h5")
+
+# Sharp frames a video prediction is based on at most
+MAX_VIDEO_FRAMES = 250
+
+# Stop decoding once the prediction has settled; None runs every video to MAX_VIDEO_FRAMES
+_early_exit_rule = early_exit.make_rule(early_exit.VIDEO_EARLY_EXIT)
+
+# Warm-up progress reported by /ready: pending, loading, ready, unavailable or failed
+model_status = {"video_model": "pending", "form_model": "pending"}
+
+# The file the VIDEO_MODEL_BACKEND runtime reads: the .h5 itself or its converted .tflite
+_VIDEO_ARTEFACT = (
+    Path(VIDEO_MODEL_PATH) if VIDEO_MODEL_BACKEND in ("keras", "xla")
+    else artefact_path(VIDEO_MODEL_PATH, VIDEO_MODEL_BACKEND)
+)
+
+def _load_video_backend(path: Path):
+    # TensorFlow takes seconds to import, so backends only pull it in here.
+    # Converted artefacts are found next to the .h5 name in the same version directory.
+    return load_video_backend(str(path.with_name(Path(VIDEO_MODEL_PATH).name)), VIDEO_MODEL_BACKEND)
+
+def _warm_up_video_backend(model) -> None:
+    # Same batch shape the scheduler always sends, so the traced graph is reused
+    model.predict_on_batch(np.zeros((VIDEO_BATCH_SIZE, 224, 224, 3), dtype=np.float32))
+
+# Versions live in ml_models/video/<version>/; without that directory VIDEO_MODEL_PATH
+# is served and reloaded whenever the file changes
+video_models = model_registry.register(
+    ModelSlot("video", _VIDEO_ARTEFACT.name, _VIDEO_ARTEFACT, _load_video_backend, warm_up=_warm_up_video_backend)
+)
 
 def _load_video_model():
-    """Load and cache the video prediction model"""
-    global _model
-    if _model is None:
-        try:
-            _model = tf.keras.models.load_model("ml_models/best_model_fine_tuned.h5")
-        except FileNotFoundError:
-            raise HTTPException(
-                status_code=503,
-                detail="Video model not loaded. Please check server configuration."
-            )
-    return _model
-
-def make_prediction(input_data: np.ndarray) -> np.ndarray:
+    """The active video prediction model on the VIDEO_MODEL_BACKEND runtime"""
+    return video_models.get().model
+
+def video_model_version(loaded: Optional[LoadedModel] = None) -> Optional[str]:
+    """Identifies the model version, runtime and gaze settings behind a video result; None if no model."""
+    if loaded is None:
+        # Before the first load, the version that will be loaded
+        loaded = video_models.peek()
+        version = loaded.version if loaded is not None else (video_models.resolve() or (None,))[0]
+    else:
+        version = loaded.version
+    if version is None:
+        return None
+    gaze = image.GAZE_DETECTOR
+    if gaze == "fast":
+        gaze = f"fast-{image.GAZE_MAX_WIDTH}-{image.GAZE_REDETECT_EVERY}-{image.GAZE_TRACK_THRESHOLD}"
+    version = f"{VIDEO_MODEL_BACKEND}:{version}:gaze-{gaze}"
+    if image.FRAME_SAMPLING == "seek":
+        version += (
+            f":seek-{image.FRAME_SEEK_MIN_STRIDE}-{image.FRAME_SEEK_GRAB_LIMIT}-{image.FRAME_RESAMPLE_ATTEMPTS}"
+            f"-thumb-{image.FRAME_BLUR_WIDTH}-{image.FRAME_BLUR_THUMB_THRESHOLD}"
+        )
+    if _early_exit_rule is not None:
+        version += f":early-{_early_exit_rule.describe()}-{early_exit.EARLY_EXIT_CHUNK_FRAMES}"
+    return version
+
+def make_prediction(input_data) -> np.ndarray:
     """
     Make a prediction using the video model.
     
     Args:
-        input_data: numpy array of shape (num_frames, 224, 224, 3)
+        input_data: frames of shape (num_frames, 224, 224, 3), either uint8 frames
+            from ``detect_blur_and_save`` or float32 frames already scaled to [0, 1]
     
     Returns:
         numpy array of predictions
@@ -61,19 +122,187 @@ def make_prediction(input_data: np.ndarray) -> np.ndarray:
         raise HTTPException(status_code=400, detail="Input data is empty")
     
     try:
-        prediction = model.predict(input_data)
-        return prediction
+        predictions = [
+            model.predict_on_batch(batch)
+            for batch in iter_model_batches(input_data, VIDEO_BATCH_SIZE)
+        ]
+        return np.concatenate(predictions)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during prediction: {str(e)}")
 
-def get_db():
-    db = SessionLocal()
+def _run_video_batch(batch: np.ndarray, model) -> np.ndarray:
+    return model.predict_on_batch(batch)
+
+# Frames from concurrent requests share model batches
+video_scheduler = BatchingScheduler(
+    _run_video_batch,
+    batch_size=VIDEO_BATCH_SIZE,
+    max_wait_ms=float(os.getenv("VIDEO_BATCH_MAX_WAIT_MS", "10")),
+    queue_depth=int(os.getenv("VIDEO_QUEUE_DEPTH", "64")),
+)
+
+async def warm_up_models() -> None:
+    """Load both models and run a dummy input through each, off the event loop."""
+    # The slots warm up every version they load, including later hot-swaps
+    for name, warm_up in (("form_model", form_models.get), ("video_model", video_models.get)):
+        model_status[name] = "loading"
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(warm_up)
+        except HTTPException as exc:
+            model_status[name] = "unavailable"
+            print(f"⚠️ {name} unavailable: {exc.detail}")
+        except Exception as exc:
+            model_status[name] = "failed"
+            print(f"⚠️ {name} warm-up failed: {exc}")
+        else:
+            model_status[name] = "ready"
+            print(f"✅ {name} warmed up in {time.perf_counter() - started:.1f}s")
+
+async def _predict_video_progressive(video_path: str, model) -> Tuple[np.ndarray, float, int]:
+    """Decode and predict chunk by chunk until the early-exit rule is satisfied."""
+    async def predict(chunk: np.ndarray) -> np.ndarray:
+        with metrics.timed("inference_wait"):
+            return await video_scheduler.predict(chunk, model=model)
+
+    result = await early_exit.run_progressive(
+        iter_sharp_frames(video_path, max_frames=MAX_VIDEO_FRAMES),
+        predict,
+        _early_exit_rule,
+        early_exit.EARLY_EXIT_CHUNK_FRAMES,
+    )
+    if result.stopped_early:
+        print(f"⏩ Prediction settled after {result.frames_used} frames")
+    gaze_percentage = sum(result.gaze_flags) / result.frames_used * 100 if result.frames_used else 0.0
+    return result.predictions, gaze_percentage, result.frames_used
+
+async def _predict_video(video_path: str) -> Tuple[str, float, float, str, int]:
+    """Run the video stage; returns (label, confidence %, eye gaze %, video model version, frames used)."""
+    try:
+        # Pinned for the whole request, so a hot-swap mid-video does not mix versions
+        loaded = await asyncio.to_thread(video_models.get)
+        if _early_exit_rule is not None:
+            video_predictions, gaze_percentage, frames_used = await _predict_video_progressive(video_path, loaded.model)
+        else:
+            frames, gaze_percentage = await detect_blur_and_save(video_path, max_frames=MAX_VIDEO_FRAMES)
+            frames_used = len(frames)
+            if frames_used:
+                # Includes queueing for a batch slot; the model time alone is the "inference" stage
+                with metrics.timed("inference_wait"):
+                    video_predictions = await video_scheduler.predict(frames, model=loaded.model)
+        if frames_used == 0:
+            raise HTTPException(status_code=400, detail="No sharp frames were detected in the video. Please upload a clearer video.")
+        early_exit.frames_used.observe(frames_used, rule=early_exit.VIDEO_EARLY_EXIT)
+        if video_predictions.size == 0:
+            raise HTTPException(status_code=500, detail="Model returned an empty prediction.")
+
+        avg_prediction = np.mean(video_predictions, axis=0)
+        predicted_class_index = int(np.argmax(avg_prediction))
+        video_label = ['Non_Autistic', 'Autistic'][predicted_class_index]
+        video_confidence = float(np.max(avg_prediction) * 100)
+        return video_label, video_confidence, gaze_percentage, video_model_version(loaded), frames_used
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Error processing video: {str(exc)}")
+
+async def _complete_prediction(
+    db: AsyncSession,
+    email: str,
+    input_data: dict,
+    video_result: Optional[Tuple[str, float, float, str, int]],
+    job: Optional[models.PredictionJob] = None,
+) -> dict:
+    """Score the form, store the record, generate the report and notify the user."""
+    form_prediction, form_probability, form_model_version = await predict_autism_versioned(input_data)
+    form_probability_value = float(form_probability) if form_probability is not None else None
+    video_label, video_confidence, gaze_percentage, video_version, video_frames_used = video_result or (None,) * 5
+
+    record = models.Data(
+        user_email=email,
+        video_prediction=video_label,
+        video_confidence=video_confidence,
+        form_prediction=str(form_prediction),
+        form_confidence=form_probability_value,
+        eye_gaze_percentage=gaze_percentage,
+        video_model_version=video_version,
+        video_frames_used=video_frames_used,
+        form_model_version=form_model_version,
+    )
+    db.add(record)
+    await db.commit()
+    await db.refresh(record)
+    if job is not None:
+        job.data_id = record.id
+
+    report_summary = await generate_and_store_report(
+        db=db,
+        record=record,
+        max_words=120,
+        additional_notes=None,
+    )
+
+    payload = {
+        "type": "report_ready",
+        "data_id": record.id,
+        "report": report_summary,
+        "video_prediction": video_label,
+        "video_confidence": video_confidence,
+        "form_prediction": form_prediction,
+        "form_confidence": form_probability_value,
+    }
+    if job is not None:
+        payload["job_id"] = job.id
+    await notification_manager.notify_report_ready(email=email, payload=payload)
+
+    response = {
+        "form": {
+            "predicted_class": int(form_prediction),
+            "confidence": f"{form_probability_value:.2f}%" if form_probability_value is not None else None,
+        },
+        "report": report_summary,
+    }
+    if video_label is not None and video_confidence is not None:
+        response["video"] = {
+            "predicted_class": video_label,
+            "confidence": f"{video_confidence:.2f}%",
+            "frames_used": video_frames_used,
+        }
+        response["eye_gaze"] = {
+            "percentage": f"{gaze_percentage:.2f}%" if gaze_percentage is not None else None,
+        }
+    else:
+        response["video"] = None
+        response["eye_gaze"] = None
+
+    return response
+
+async def _run_job(db: AsyncSession, job: models.PredictionJob) -> dict:
+    """Job handler for ``mode=async`` submissions, run by a background worker."""
     try:
-        yield db
+        video_result = None
+        if job.video_path:
+            version = video_model_version()
+            video_result = await get_video_result(job.video_hash, version)
+            if video_result is None:
+                video_result = await _predict_video(job.video_path)
+                await store_video_result(job.video_hash, video_result)
+        return await _complete_prediction(db, job.user_email, json.loads(job.form_input), video_result, job=job)
+    except Exception as exc:
+        await notification_manager.notify_report_ready(
+            email=job.user_email,
+            payload={"type": "job_failed", "job_id": job.id, "error": str(getattr(exc, "detail", None) or exc)},
+        )
+        raise
     finally:
-        db.close()
+        if job.video_path and os.path.exists(job.video_path):
+            os.remove(job.video_path)
 
-db_dependency = Annotated[Session, Depends(get_db)]
+job_workers = JobWorkerPool(
+    _run_job,
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    poll_seconds=float(os.getenv("JOB_POLL_SECONDS", "1")),
+)
 
 @router.post("/combined", status_code=201)
 async def combined_prediction(
@@ -93,6 +322,7 @@ async def combined_prediction(
     Ethnicity: str = Form(...),
     Jaundice: str = Form(...),
     Family_mem_with_ASD: str = Form(...),
+    mode: Literal["sync", "async"] = Query("sync", description="`async` queues the prediction and returns 202 with a job id"),
     current_user: dict = Depends(get_current_user),
     db: db_dependency = None
 ):
@@ -105,96 +335,80 @@ async def combined_prediction(
         "Jaundice": Jaundice,
         "Family_mem_with_ASD": Family_mem_with_ASD,
     }
-    form_prediction, form_probability = await predict_autism(input_data)
-    form_probability_value = float(form_probability) if form_probability is not None else None
 
-    video_label: Optional[str] = None
-    video_confidence: Optional[float] = None
-    gaze_percentage: Optional[float] = None
-    video_path: Optional[str] = None
+    if file is not None and (not file.content_type or not file.content_type.startswith("video/")):
+        raise HTTPException(status_code=400, detail="Invalid video file")
 
-    if file is not None:
-        if not file.content_type or not file.content_type.startswith("video/"):
-            raise HTTPException(status_code=400, detail="Invalid video file")
-        contents = await file.read()
-        if len(contents) == 0:
-            raise HTTPException(status_code=400, detail="Empty video file")
-        if len(contents) > 1000 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File size exceeds the maximum limit of 1000MB")
+    if mode == "async":
+        video_path = None
+        if file is not None:
+            upload = SpooledUpload(suffix=os.path.splitext(file.filename or "")[1], directory=JOB_STORAGE_DIR)
+            try:
+                await upload.write_from(file)
+            except BaseException:
+                upload.cleanup()
+                raise
+            video_path = upload.path
+        job = await enqueue_job(
+            db, current_user["email"], input_data, video_path,
+            video_hash=upload.content_hash if file is not None else None,
+        )
+        job_workers.wake()
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": job.id, "status": job.status, "status_url": f"{router.prefix}/jobs/{job.id}"},
+        )
 
+    video_result = None
+    if file is not None:
+        upload = SpooledUpload(suffix=os.path.splitext(file.filename or "")[1])
+        version = video_model_version()
         try:
-            suffix = os.path.splitext(file.filename or "")[1]
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                tmp.write(contents)
-                video_path = tmp.name
-
-            frames, gaze_percentage = await detect_blur_and_save(video_path, max_frames=250)
-            if frames.size == 0:
-                raise HTTPException(status_code=400, detail="No sharp frames were detected in the video. Please upload a clearer video.")
-
-            video_predictions = await asyncio.to_thread(make_prediction, frames)
-            if video_predictions.size == 0:
-                raise HTTPException(status_code=500, detail="Model returned an empty prediction.")
-
-            avg_prediction = np.mean(video_predictions, axis=0)
-            predicted_class_index = int(np.argmax(avg_prediction))
-            video_label = ['Non_Autistic', 'Autistic'][predicted_class_index]
-            video_confidence = float(np.max(avg_prediction) * 100)
-        except Exception as exc:
-            raise HTTPException(status_code=500, detail=f"Error processing video: {str(exc)}")
+            # The body has already been received by the time the handler runs, so the
+            # copy is local; the video stage starts once it is complete and hashed
+            await upload.write_from(file)
+            video_result = await get_video_result(upload.content_hash, version)
+            if video_result is None:
+                video_result = await _predict_video(upload.path)
+                await store_video_result(upload.content_hash, video_result)
         finally:
-            if video_path and os.path.exists(video_path):
-                os.remove(video_path)
+            upload.cleanup()
 
-    record = models.Data(
-        user_email=current_user["email"],
-        video_prediction=video_label,
-        video_confidence=video_confidence,
-        form_prediction=str(form_prediction),
-        form_confidence=form_probability_value,
-        eye_gaze_percentage=gaze_percentage,
-    )
-    db.add(record)
-    db.commit()
-    db.refresh(record)
+    return await _complete_prediction(db, current_user["email"], input_data, video_result)
 
-    report_summary = generate_and_store_report(
-        db=db,
-        record=record,
-        max_words=120,
-        additional_notes=None,
-    )
+@router.get("/jobs/{job_id}")
+async def get_job_status(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: db_dependency = None
+):
+    job = await db.get(models.PredictionJob, job_id)
+    if job is None or job.user_email != current_user["email"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "data_id": job.data_id,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
 
-    await notification_manager.notify_report_ready(
-        email=current_user["email"],
-        payload={
-            "type": "report_ready",
-            "data_id": record.id,
-            "report": report_summary,
-            "video_prediction": video_label,
-            "video_confidence": video_confidence,
-            "form_prediction": form_prediction,
-            "form_confidence": form_probability_value,
-        },
-    )
+@router.post("/forms/batch")
+async def batch_form_prediction(batch: QuestionnaireBatch):
+    """Score many questionnaires (e.g. a clinic-wide screening import) in one model call."""
+    if len(batch.questionnaires) > MAX_FORM_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FORM_BATCH} questionnaires per request")
 
-    response = {
-        "form": {
-            "predicted_class": int(form_prediction),
-            "confidence": f"{form_probability_value:.2f}%" if form_probability_value is not None else None,
-        },
-        "report": report_summary,
-    }
-    if video_label is not None and video_confidence is not None:
-        response["video"] = {
-            "predicted_class": video_label,
-            "confidence": f"{video_confidence:.2f}%",
-        }
-        response["eye_gaze"] = {
-            "percentage": f"{gaze_percentage:.2f}%" if gaze_percentage is not None else None,
-        }
-    else:
-        response["video"] = None
-        response["eye_gaze"] = None
+    rows = [item.model_dump() for item in batch.questionnaires]
+    predictions, probabilities = await asyncio.to_thread(predict_autism_batch, rows)
 
-    return response
\ No newline at end of file
+    results = [
+        {
+            "predicted_class": int(prediction),
+            "probability": float(probabilities[i]) if probabilities is not None else None,
+        }
+        for i, prediction in enumerate(predictions)
+    ]
+    return {"count": len(results), "results": results}
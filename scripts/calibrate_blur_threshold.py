@@ -0,0 +1,124 @@
+"""Calibrate FRAME_BLUR_THUMB_THRESHOLD against the full-resolution blur test.
+
+Usage (from the project root):
+
+    python scripts/calibrate_blur_threshold.py --videos path/to/videos --min-agreement 0.95
+
+Frames spread over every video in ``--videos`` are scored twice: the Laplacian
+variance at full resolution, which ``--threshold`` (the API's 50) was tuned for,
+and on the FRAME_BLUR_WIDTH-wide thumbnail that FRAME_SAMPLING=seek can use.
+The full-resolution decision (score >= threshold) is the reference. The JSON
+report gives the thumbnail threshold that agrees with it most often, how often
+it agrees, and how many frames it would wrongly keep or reject. If
+``--thumb-threshold`` is given (default: FRAME_BLUR_THUMB_THRESHOLD), that value
+is scored as well. The script exits non-zero if the threshold being checked
+agrees on fewer than ``--min-agreement`` of the frames.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import image  # noqa: E402
+
+VIDEO_SUFFIXES = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
+
+
+def score_video(path: Path, frames: int, width: int):
+    """(full-resolution, thumbnail) Laplacian variances of up to ``frames`` evenly spaced frames."""
+    cap = cv2.VideoCapture(str(path))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    step = max(1, total // frames) if total else 1
+    full, thumb = [], []
+    index = 0
+    while len(full) < frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % step == 0:
+            full.append(cv2.Laplacian(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var())
+            thumb.append(image._blur_score(frame, width))
+        index += 1
+    cap.release()
+    return full, thumb
+
+
+def agreement(sharp: np.ndarray, thumb: np.ndarray, threshold: float) -> dict:
+    kept = thumb >= threshold
+    return {
+        "threshold": threshold,
+        "agreement": float(np.mean(kept == sharp)),
+        "wrongly_kept": int(np.count_nonzero(kept & ~sharp)),
+        "wrongly_rejected": int(np.count_nonzero(~kept & sharp)),
+    }
+
+
+def best_threshold(sharp: np.ndarray, thumb: np.ndarray) -> float:
+    """The cut between neighbouring thumbnail scores that matches ``sharp`` most often."""
+    order = np.argsort(thumb)
+    scores, labels = thumb[order], sharp[order]
+    # Cutting before position i rejects scores[:i] and keeps scores[i:]
+    rejected_blurry = np.concatenate([[0], np.cumsum(~labels)])
+    kept_sharp = np.count_nonzero(labels) - np.concatenate([[0], np.cumsum(labels)])
+    best = int(np.argmax(rejected_blurry + kept_sharp))
+    if best == 0:
+        return float(scores[0])
+    if best == len(scores):
+        return float(scores[-1]) + 1.0
+    return float((scores[best - 1] + scores[best]) / 2)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=Path, required=True)
+    parser.add_argument("--threshold", type=float, default=50.0, help="full-resolution threshold, as in the API")
+    parser.add_argument("--width", type=int, default=image.FRAME_BLUR_WIDTH)
+    parser.add_argument("--thumb-threshold", type=float, default=image.FRAME_BLUR_THUMB_THRESHOLD or None)
+    parser.add_argument("--frames-per-video", type=int, default=300)
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--report", type=Path, help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    full, thumb, videos = [], [], []
+    for path in sorted(args.videos.iterdir()):
+        if path.suffix.lower() not in VIDEO_SUFFIXES:
+            continue
+        video_full, video_thumb = score_video(path, args.frames_per_video, args.width)
+        full.extend(video_full)
+        thumb.extend(video_thumb)
+        videos.append({
+            "video": path.name,
+            "frames": len(video_full),
+            "sharp_fraction": float(np.mean(np.asarray(video_full) >= args.threshold)) if video_full else None,
+        })
+    if not full:
+        raise SystemExit(f"No frames found in {args.videos}")
+
+    sharp = np.asarray(full) >= args.threshold
+    thumb = np.asarray(thumb)
+    suggested = agreement(sharp, thumb, best_threshold(sharp, thumb))
+    checked = agreement(sharp, thumb, args.thumb_threshold) if args.thumb_threshold else suggested
+    report = {
+        "settings": {"threshold": args.threshold, "width": args.width, "min_agreement": args.min_agreement},
+        "videos": videos,
+        "frames": len(full),
+        "suggested": suggested,
+        # The same threshold on the thumbnail, for comparison
+        "unscaled": agreement(sharp, thumb, args.threshold),
+        "checked": checked,
+        "passed": checked["agreement"] >= args.min_agreement,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.report:
+        args.report.write_text(output)
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Convert the video model for faster CPU inference and check it still agrees with the original.
+
+Usage (from the project root):
+
+    python scripts/convert_video_model.py --videos videos/holdout --backends tflite-fp16 tflite-int8 xla
+
+Sharp frames are extracted from every video in ``--videos`` exactly as the API
+does, shuffled, and split into a calibration set (int8 quantisation only) and a
+disjoint held-out set. Each backend is scored on the held-out frames against the
+Keras model; the report gives per-class agreement of the predicted class, the
+largest probability difference and throughput. Converted models are written
+next to the .h5 file, where ``VIDEO_MODEL_BACKEND`` looks for them.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from image import detect_blur_and_save, iter_model_batches  # noqa: E402
+from services.video_backends import BACKENDS, KerasBackend, artefact_path, load_video_backend  # noqa: E402
+
+VIDEO_SUFFIXES = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
+
+
+def load_frames(video_dir: Path, frames_per_video: int) -> np.ndarray:
+    """uint8 sharp frames from every video in ``video_dir``."""
+    parts = []
+    for path in sorted(video_dir.iterdir()):
+        if path.suffix.lower() not in VIDEO_SUFFIXES:
+            continue
+        frames, _ = asyncio.run(detect_blur_and_save(str(path), max_frames=frames_per_video))
+        if len(frames):
+            parts.append(np.asarray(frames))
+    if not parts:
+        raise SystemExit(f"No sharp frames found in {video_dir}")
+    return np.concatenate(parts)
+
+
+def predict(model, frames: np.ndarray, batch_size: int):
+    """Predictions for ``frames`` and the throughput in frames per second."""
+    outputs = []
+    started = time.perf_counter()
+    for batch in iter_model_batches(frames, batch_size):
+        outputs.append(np.array(model.predict_on_batch(batch)))
+    elapsed = time.perf_counter() - started
+    return np.concatenate(outputs), len(frames) / elapsed
+
+
+def convert_tflite(model_path: str, backend: str, calibration: np.ndarray, batch_size: int) -> Path:
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if backend == "tflite-fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        def representative_dataset():
+            for batch in iter_model_batches(calibration, batch_size):
+                for frame in batch:
+                    yield [frame[np.newaxis].copy()]
+
+        # Full-integer kernels; inputs and outputs stay float32 so callers need no changes
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    out_path = artefact_path(model_path, backend)
+    out_path.write_bytes(converter.convert())
+    return out_path
+
+
+def parity_report(reference: np.ndarray, candidate: np.ndarray, class_names) -> dict:
+    expected = reference.argmax(axis=1)
+    actual = candidate.argmax(axis=1)
+    per_class = {}
+    for index, name in enumerate(class_names):
+        mask = expected == index
+        per_class[name] = {
+            "frames": int(mask.sum()),
+            "agreement": float((actual[mask] == index).mean()) if mask.any() else None,
+        }
+    return {
+        "agreement": float((expected == actual).mean()),
+        "per_class": per_class,
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+        "mean_abs_diff": float(np.abs(reference - candidate).mean()),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="ml_models/best_model_fine_tuned.h5")
+    parser.add_argument("--videos", type=Path, required=True, help="directory of videos to draw frames from")
+    parser.add_argument("--backends", nargs="+", default=["tflite-fp16", "tflite-int8"],
+                        choices=[b for b in BACKENDS if b != "keras"])
+    parser.add_argument("--frames-per-video", type=int, default=250)
+    parser.add_argument("--calibration-frames", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="fail if any class agrees less often than this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=Path, help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    frames = load_frames(args.videos, args.frames_per_video)
+    order = np.random.default_rng(args.seed).permutation(len(frames))
+    calibration = frames[order[:args.calibration_frames]]
+    holdout = frames[order[args.calibration_frames:]]
+    if not len(holdout):
+        raise SystemExit("Not enough frames for a held-out set; add videos or lower --calibration-frames")
+
+    class_names = ["Non_Autistic", "Autistic"]
+    reference, reference_fps = predict(KerasBackend(args.model), holdout, args.batch_size)
+    report = {
+        "model": args.model,
+        "holdout_frames": int(len(holdout)),
+        "calibration_frames": int(len(calibration)),
+        "keras": {"frames_per_second": reference_fps},
+    }
+
+    passed = True
+    for backend in args.backends:
+        entry = {}
+        if backend.startswith("tflite"):
+            entry["artefact"] = str(convert_tflite(args.model, backend, calibration, args.batch_size))
+        candidate, fps = predict(load_video_backend(args.model, backend), holdout, args.batch_size)
+        entry.update(parity_report(reference, candidate, class_names))
+        entry["frames_per_second"] = fps
+        entry["speedup"] = fps / reference_fps
+        agreements = [c["agreement"] for c in entry["per_class"].values() if c["agreement"] is not None]
+        entry["passed"] = min(agreements, default=0.0) >= args.min_agreement
+        passed = passed and entry["passed"]
+        report[backend] = entry
+        if "artefact" in entry:
+            Path(entry["artefact"] + ".parity.json").write_text(json.dumps(entry, indent=2))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.report:
+        args.report.write_text(output)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Compare early-exit video predictions with the full-run baseline.
+
+Usage (from the project root):
+
+    python scripts/evaluate_early_exit.py --videos path/to/videos --rules ci sprt --timed
+
+Every video goes through ``detect_blur_and_save`` and the video model exactly as
+the API does with ``VIDEO_EARLY_EXIT=off``: up to ``--max-frames`` sharp frames,
+averaged. Each rule is then replayed on the same per-frame predictions, checking
+after every chunk as a progressive request would, which gives the frames it
+would have used and the label and confidence it would have returned. The JSON
+report lists, per rule, how often the label agrees with the full run, the
+confidence difference in percentage points and the share of frames saved.
+``--timed`` also runs the real progressive pipeline per video to measure the
+wall-clock saving. The script exits non-zero if any rule agrees on fewer than
+``--min-agreement`` of the videos.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from image import detect_blur_and_save, iter_model_batches, iter_sharp_frames  # noqa: E402
+from services import early_exit  # noqa: E402
+from services.video_backends import BACKENDS, VIDEO_MODEL_BACKEND, load_video_backend  # noqa: E402
+
+VIDEO_SUFFIXES = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
+CLASS_NAMES = ["Non_Autistic", "Autistic"]
+
+
+def summarise(predictions: np.ndarray):
+    """(label, confidence %) for the mean of ``predictions``, as the API reports them."""
+    average = np.mean(predictions, axis=0)
+    return CLASS_NAMES[int(np.argmax(average))], float(np.max(average) * 100)
+
+
+def predict(model, frames, batch_size: int) -> np.ndarray:
+    return np.concatenate([np.array(model.predict_on_batch(batch)) for batch in iter_model_batches(frames, batch_size)])
+
+
+async def full_run(model, path: Path, args):
+    started = time.perf_counter()
+    frames, _ = await detect_blur_and_save(str(path), max_frames=args.max_frames)
+    predictions = predict(model, frames, args.batch_size) if len(frames) else np.empty((0, 2), dtype=np.float32)
+    return predictions, time.perf_counter() - started
+
+
+async def progressive_run(model, path: Path, rule, args):
+    async def predict_chunk(chunk: np.ndarray) -> np.ndarray:
+        return await asyncio.to_thread(predict, model, chunk, args.batch_size)
+
+    started = time.perf_counter()
+    result = await early_exit.run_progressive(
+        iter_sharp_frames(str(path), max_frames=args.max_frames), predict_chunk, rule, args.chunk_frames,
+    )
+    return result.frames_used, time.perf_counter() - started
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=Path, required=True)
+    parser.add_argument("--rules", nargs="+", choices=early_exit.RULES[1:], default=list(early_exit.RULES[1:]))
+    parser.add_argument("--model", default=os.getenv("VIDEO_MODEL_PATH", "ml_models/best_model_fine_tuned.h5"))
+    parser.add_argument("--backend", choices=BACKENDS, default=VIDEO_MODEL_BACKEND)
+    parser.add_argument("--max-frames", type=int, default=250, help="same cap as the API")
+    parser.add_argument("--chunk-frames", type=int, default=early_exit.EARLY_EXIT_CHUNK_FRAMES)
+    parser.add_argument("--min-frames", type=int, default=early_exit.EARLY_EXIT_MIN_FRAMES)
+    parser.add_argument("--ci-z", type=float, default=early_exit.EARLY_EXIT_CI_Z)
+    parser.add_argument("--ci-half-width", type=float, default=early_exit.EARLY_EXIT_CI_HALF_WIDTH)
+    parser.add_argument("--sprt-delta", type=float, default=early_exit.EARLY_EXIT_SPRT_DELTA)
+    parser.add_argument("--sprt-alpha", type=float, default=early_exit.EARLY_EXIT_SPRT_ALPHA)
+    parser.add_argument("--sprt-beta", type=float, default=early_exit.EARLY_EXIT_SPRT_BETA)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--timed", action="store_true", help="also time the real progressive pipeline")
+    parser.add_argument("--min-agreement", type=float, default=1.0, help="required share of videos with the full-run label")
+    parser.add_argument("--report", type=Path, help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    rules = {
+        "ci": early_exit.ConfidenceIntervalRule(args.min_frames, args.ci_z, args.ci_half_width),
+        "sprt": early_exit.SequentialTestRule(args.min_frames, args.sprt_delta, args.sprt_alpha, args.sprt_beta),
+    }
+    rules = {name: rules[name] for name in args.rules}
+    model = load_video_backend(args.model, args.backend)
+
+    videos = []
+    for path in sorted(args.videos.iterdir()):
+        if path.suffix.lower() not in VIDEO_SUFFIXES:
+            continue
+        predictions, full_seconds = asyncio.run(full_run(model, path, args))
+        if not len(predictions):
+            print(f"⚠️ No sharp frames in {path.name}, skipped", file=sys.stderr)
+            continue
+        label, confidence = summarise(predictions)
+        entry = {
+            "video": path.name,
+            "sharp_frames": len(predictions),
+            "full": {"label": label, "confidence": confidence, "seconds": full_seconds},
+        }
+        for name, rule in rules.items():
+            used = early_exit.frames_to_decision(predictions, rule, args.chunk_frames)
+            early_label, early_confidence = summarise(predictions[:used])
+            entry[name] = {
+                "frames_used": used,
+                "label": early_label,
+                "confidence": early_confidence,
+                "agrees": early_label == label,
+                "confidence_difference": abs(early_confidence - confidence),
+            }
+            if args.timed:
+                frames_used, seconds = asyncio.run(progressive_run(model, path, rule, args))
+                entry[name]["seconds"] = seconds
+                # Replay and real run check the rule at the same chunk boundaries
+                entry[name]["replay_matches"] = frames_used == used
+        videos.append(entry)
+    if not videos:
+        raise SystemExit(f"No videos with sharp frames found in {args.videos}")
+
+    summary = {}
+    for name, rule in rules.items():
+        results = [video[name] for video in videos]
+        differences = [result["confidence_difference"] for result in results]
+        frames_used = sum(result["frames_used"] for result in results)
+        summary[name] = {
+            "rule": rule.describe(),
+            "agreement": sum(result["agrees"] for result in results) / len(results),
+            "max_confidence_difference": max(differences),
+            "mean_confidence_difference": sum(differences) / len(differences),
+            "mean_frames_used": frames_used / len(results),
+            "frames_saved": 1 - frames_used / sum(video["sharp_frames"] for video in videos),
+        }
+        if args.timed:
+            full_seconds = sum(video["full"]["seconds"] for video in videos)
+            summary[name]["speedup"] = full_seconds / sum(result["seconds"] for result in results)
+
+    report = {
+        "settings": {
+            "model": args.model,
+            "backend": args.backend,
+            "max_frames": args.max_frames,
+            "chunk_frames": args.chunk_frames,
+            "min_agreement": args.min_agreement,
+        },
+        "videos": videos,
+        "summary": summary,
+        "passed": all(rule["agreement"] >= args.min_agreement for rule in summary.values()),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.report:
+        args.report.write_text(output)
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
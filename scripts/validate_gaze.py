@@ -0,0 +1,91 @@
+"""Compare the fast eye-gaze detector with the full-resolution reference.
+
+Usage (from the project root):
+
+    python scripts/validate_gaze.py --videos path/to/videos --tolerance 5
+
+Every video goes through ``detect_blur_and_save`` twice, once with
+``GAZE_DETECTOR=full`` and once with ``fast`` using the given settings. The JSON
+report lists eye_gaze_percentage from both, the absolute difference in
+percentage points and the time spent in each run. The script exits non-zero if
+any video differs by more than ``--tolerance`` points.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import image  # noqa: E402
+
+VIDEO_SUFFIXES = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
+
+
+def measure(path: Path, mode: str, max_frames: int):
+    image.GAZE_DETECTOR = mode
+    started = time.perf_counter()
+    frames, gaze_percentage = asyncio.run(image.detect_blur_and_save(str(path), max_frames=max_frames))
+    return gaze_percentage, time.perf_counter() - started, len(frames)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=Path, required=True)
+    parser.add_argument("--tolerance", type=float, default=5.0, help="allowed difference in percentage points")
+    parser.add_argument("--max-width", type=int, default=image.GAZE_MAX_WIDTH)
+    parser.add_argument("--redetect-every", type=int, default=image.GAZE_REDETECT_EVERY)
+    parser.add_argument("--track-threshold", type=float, default=image.GAZE_TRACK_THRESHOLD)
+    parser.add_argument("--max-frames", type=int, default=250, help="same cap as the API")
+    parser.add_argument("--report", type=Path, help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    image.GAZE_MAX_WIDTH = args.max_width
+    image.GAZE_REDETECT_EVERY = args.redetect_every
+    image.GAZE_TRACK_THRESHOLD = args.track_threshold
+
+    videos = []
+    for path in sorted(args.videos.iterdir()):
+        if path.suffix.lower() not in VIDEO_SUFFIXES:
+            continue
+        reference, reference_seconds, frames = measure(path, "full", args.max_frames)
+        fast, fast_seconds, _ = measure(path, "fast", args.max_frames)
+        videos.append({
+            "video": path.name,
+            "sharp_frames": frames,
+            "full_gaze_percentage": reference,
+            "fast_gaze_percentage": fast,
+            "difference": abs(fast - reference),
+            "full_seconds": reference_seconds,
+            "fast_seconds": fast_seconds,
+        })
+    if not videos:
+        raise SystemExit(f"No videos found in {args.videos}")
+
+    differences = [video["difference"] for video in videos]
+    full_seconds = sum(video["full_seconds"] for video in videos)
+    fast_seconds = sum(video["fast_seconds"] for video in videos)
+    report = {
+        "settings": {
+            "max_width": args.max_width,
+            "redetect_every": args.redetect_every,
+            "track_threshold": args.track_threshold,
+            "tolerance": args.tolerance,
+        },
+        "videos": videos,
+        "max_difference": max(differences),
+        "mean_difference": sum(differences) / len(differences),
+        "speedup": full_seconds / fast_seconds if fast_seconds else None,
+        "passed": max(differences) <= args.tolerance,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.report:
+        args.report.write_text(output)
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
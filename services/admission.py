@@ -0,0 +1,237 @@
+"""Admission control for heavy endpoints.
+
+Each limited endpoint runs at most ``max_concurrency`` requests per worker.
+Up to ``queue_size`` more wait in line for at most ``max_wait_seconds``.
+Anything beyond that is answered straight away with 503 and ``Retry-After``,
+before its body is read. Optional per-user limits, keyed on the email in the
+request's JWT, answer 429 instead. Light endpoints never queue here, so they
+keep their latency while the heavy ones are saturated.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from services import metrics
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# Users whose per-minute allowance is tracked at once; the least recently seen are dropped
+_MAX_TRACKED_USERS = 10000
+
+admissions = metrics.registry.counter(
+    "cognicare_admission_total",
+    "Admission decisions for limited endpoints",
+    ("endpoint", "outcome"),
+)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionLimiter:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        queue_size: int,
+        max_wait_seconds: float,
+        user_concurrency: int = 0,
+        user_per_minute: float = 0.0,
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_size = max(0, queue_size)
+        self.max_wait_seconds = max_wait_seconds
+        self.user_concurrency = user_concurrency
+        self.user_per_minute = user_per_minute
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._user_in_flight: Dict[str, int] = {}
+        # email -> (tokens left, last refill), a token bucket refilled at user_per_minute
+        self._user_tokens: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        # Smoothed time one request holds a slot, for Retry-After estimates
+        self._service_seconds = 1.0
+
+    @property
+    def uses_user_limits(self) -> bool:
+        return bool(self.user_concurrency or self.user_per_minute)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _estimate_wait(self, position: int) -> float:
+        return self._service_seconds * position / self.max_concurrency
+
+    def _user_tokens_left(self, user: str, spend: float = 0.0) -> float:
+        now = time.monotonic()
+        tokens, updated = self._user_tokens.pop(user, (self.user_per_minute, now))
+        tokens = min(self.user_per_minute, tokens + (now - updated) * self.user_per_minute / 60.0) - spend
+        self._user_tokens[user] = (tokens, now)
+        while len(self._user_tokens) > _MAX_TRACKED_USERS:
+            self._user_tokens.popitem(last=False)
+        return tokens
+
+    async def acquire(self, user: Optional[str] = None) -> bool:
+        """Wait for a slot; True if the request had to queue.
+
+        Raises AdmissionRejected when there is no slot to be had in time.
+        """
+        if user is not None:
+            if self.user_concurrency and self._user_in_flight.get(user, 0) >= self.user_concurrency:
+                raise AdmissionRejected(
+                    429, f"At most {self.user_concurrency} such requests per user at a time", self._service_seconds,
+                )
+            if self.user_per_minute:
+                tokens = self._user_tokens_left(user)
+                if tokens < 1.0:
+                    raise AdmissionRejected(
+                        429, "Request quota exceeded for this user", (1.0 - tokens) * 60.0 / self.user_per_minute,
+                    )
+
+        if user is not None:
+            # Queued requests count too, so one user cannot fill the queue
+            self._user_in_flight[user] = self._user_in_flight.get(user, 0) + 1
+        try:
+            queued = await self._acquire_slot()
+        except BaseException:
+            self._user_done(user)
+            raise
+        if user is not None and self.user_per_minute:
+            # Only admitted requests count against the allowance
+            self._user_tokens_left(user, spend=1.0)
+        return queued
+
+    async def _acquire_slot(self) -> bool:
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            return False
+        if len(self._waiters) >= self.queue_size:
+            raise AdmissionRejected(503, "Server is busy, please retry later", self._estimate_wait(len(self._waiters) + 1))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot over by resolving the future
+            await asyncio.wait_for(waiter, self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected(
+                503, "Timed out waiting for capacity, please retry later", self._estimate_wait(len(self._waiters) + 1),
+            )
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Given a slot just as the client went away
+                self._release_slot()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return True
+
+    def release(self, user: Optional[str] = None, held_seconds: Optional[float] = None) -> None:
+        if held_seconds is not None:
+            self._service_seconds += 0.2 * (held_seconds - self._service_seconds)
+        self._user_done(user)
+        self._release_slot()
+
+    def _user_done(self, user: Optional[str]) -> None:
+        if user is None:
+            return
+        remaining = self._user_in_flight.get(user, 0) - 1
+        if remaining > 0:
+            self._user_in_flight[user] = remaining
+        else:
+            self._user_in_flight.pop(user, None)
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the next in line; in_flight is unchanged
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+def limiter_from_env(name: str, prefix: str, concurrency: int, queue_size: int, max_wait_seconds: float) -> AdmissionLimiter:
+    """A limiter configured by ``<prefix>_MAX_CONCURRENCY``, ``_QUEUE_SIZE``, ``_QUEUE_TIMEOUT_SECONDS``,
+    ``_USER_CONCURRENCY`` and ``_USER_PER_MINUTE`` (0 turns a per-user limit off)."""
+    return AdmissionLimiter(
+        name,
+        max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(concurrency))),
+        queue_size=int(os.getenv(f"{prefix}_QUEUE_SIZE", str(queue_size))),
+        max_wait_seconds=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", str(max_wait_seconds))),
+        user_concurrency=int(os.getenv(f"{prefix}_USER_CONCURRENCY", "0")),
+        user_per_minute=float(os.getenv(f"{prefix}_USER_PER_MINUTE", "0")),
+    )
+
+
+class AdmissionMiddleware:
+    """Apply a limiter per (method, path); other requests pass straight through.
+
+    ``identify`` returns the verified email for a request's scope, or None.
+    """
+
+    def __init__(
+        self,
+        app,
+        limiters: Dict[Tuple[str, str], AdmissionLimiter],
+        identify: Optional[Callable[[dict], Awaitable[Optional[str]]]] = None,
+    ) -> None:
+        self.app = app
+        self.limiters = limiters
+        self.identify = identify
+        by_name = {limiter.name: limiter for limiter in limiters.values()}
+        metrics.registry.gauge(
+            "cognicare_admission_in_flight", "Requests holding a slot, per limited endpoint",
+            lambda: {name: limiter.in_flight for name, limiter in by_name.items()}, "endpoint",
+        )
+        metrics.registry.gauge(
+            "cognicare_admission_queued", "Requests waiting for a slot, per limited endpoint",
+            lambda: {name: limiter.queued for name, limiter in by_name.items()}, "endpoint",
+        )
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if limiter is None or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        user = None
+        if self.identify is not None and limiter.uses_user_limits:
+            user = await self.identify(scope)
+        try:
+            queued = await limiter.acquire(user)
+        except AdmissionRejected as exc:
+            admissions.inc(endpoint=limiter.name, outcome=f"rejected_{exc.status_code}")
+            await self._reject(send, exc)
+            return
+        admissions.inc(endpoint=limiter.name, outcome="queued" if queued else "admitted")
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(user, time.perf_counter() - started)
+
+    async def _reject(self, send, error: AdmissionRejected) -> None:
+        body = ('{"detail":"%s"}' % error.detail).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(error.retry_after).encode("latin-1")),
+                # The unread upload body would otherwise be waited for on this connection
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
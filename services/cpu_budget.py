@@ -0,0 +1,93 @@
+"""Split a host's cores between worker processes and the thread pools inside them.
+
+TensorFlow, OpenCV, BLAS and joblib each size their pools to every core by
+default, so N workers start N times as many busy threads as there are cores.
+``apply`` turns a total budget (``CPU_BUDGET``, default: the cores this process
+may use) into per-worker thread counts and exports them as environment
+variables. It must run before NumPy or TensorFlow is imported, which is why
+gunicorn.conf.py calls it, and it only sets variables that are not already set.
+
+Within a worker, a request's decode overlaps the previous request's inference,
+so decode (``FRAME_WORKERS`` with single-threaded OpenCV calls) and inference
+(TF intra-op / TFLite threads) both get the worker's share. That bounds
+oversubscription at about 2x instead of N x cores.
+
+This module must not import NumPy or anything that does.
+"""
+import os
+from typing import Dict, NamedTuple
+
+# Total cores for all workers together; 0 means every core this process may use
+CPU_BUDGET = int(os.getenv("CPU_BUDGET", "0"))
+
+# Native pools that read their size from the environment when the library loads
+_BLAS_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+class ThreadBudget(NamedTuple):
+    workers: int
+    cores_per_worker: int
+    tf_intra_op: int
+    tf_inter_op: int
+    frame_workers: int
+    cv2_threads: int
+    blas_threads: int
+
+
+def available_cpus() -> int:
+    """Cores usable by this process: CPU affinity, capped by a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            # A 1.5-core container gets 1, never more threads than it can run
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def plan(workers: int, budget: int = 0) -> ThreadBudget:
+    budget = budget or CPU_BUDGET or available_cpus()
+    workers = max(1, workers)
+    per_worker = max(1, budget // workers)
+    return ThreadBudget(
+        workers=workers,
+        cores_per_worker=per_worker,
+        tf_intra_op=per_worker,
+        # One batch runs at a time per worker, so there is little to overlap between ops
+        tf_inter_op=1 if per_worker < 4 else 2,
+        frame_workers=per_worker,
+        # Decode parallelism comes from FRAME_WORKERS segments, not from inside OpenCV calls
+        cv2_threads=1,
+        blas_threads=1,
+    )
+
+
+def apply(workers: int, budget: int = 0) -> Dict[str, str]:
+    """Export the plan for ``workers`` processes; returns the variables now in effect."""
+    threads = plan(workers, budget)
+    values = {name: threads.blas_threads for name in _BLAS_VARIABLES}
+    values.update({
+        # joblib/loky, used by scikit-learn
+        "LOKY_MAX_CPU_COUNT": threads.cores_per_worker,
+        "FORM_MODEL_JOBS": 1,
+        "TF_INTRA_OP_THREADS": threads.tf_intra_op,
+        "TF_INTER_OP_THREADS": threads.tf_inter_op,
+        "TFLITE_THREADS": threads.tf_intra_op,
+        "FRAME_WORKERS": threads.frame_workers,
+        "CV2_THREADS": threads.cv2_threads,
+    })
+    for name, value in values.items():
+        os.environ.setdefault(name, str(value))
+    return {name: os.environ[name] for name in values}
@@ -0,0 +1,162 @@
+"""Stop the video stage once the averaged prediction has settled.
+
+In progressive mode frames are predicted in chunks of ``EARLY_EXIT_CHUNK_FRAMES``
+while the rest of the video is still being decoded. After each chunk a stopping
+rule looks at every per-frame prediction so far; once it fires the decode is
+abandoned and the result is the mean over the frames used.
+
+``ci``: the normal-approximation confidence interval of the mean "Autistic"
+probability is narrower than ``EARLY_EXIT_CI_HALF_WIDTH`` and lies entirely on
+one side of 0.5, i.e. both the confidence and the label have settled.
+
+``sprt``: Wald's sequential probability ratio test on the per-frame votes,
+"Autistic" in a fraction 0.5 + delta of frames against 0.5 - delta, with error
+rates alpha and beta. It settles the label only; the confidence reported is
+the mean over the frames seen, which may differ more from a full run.
+
+Neighbouring frames are far from independent, so both rules wait for
+``EARLY_EXIT_MIN_FRAMES`` first. scripts/evaluate_early_exit.py measures how
+often each setting agrees with a full run.
+"""
+import math
+import os
+from typing import AsyncIterator, Awaitable, Callable, List, NamedTuple, Tuple
+
+import numpy as np
+
+from services import metrics
+
+# off, ci or sprt
+VIDEO_EARLY_EXIT = os.getenv("VIDEO_EARLY_EXIT", "off").lower()
+EARLY_EXIT_CHUNK_FRAMES = int(os.getenv("EARLY_EXIT_CHUNK_FRAMES", "32"))
+EARLY_EXIT_MIN_FRAMES = int(os.getenv("EARLY_EXIT_MIN_FRAMES", "64"))
+EARLY_EXIT_CI_Z = float(os.getenv("EARLY_EXIT_CI_Z", "2.58"))
+EARLY_EXIT_CI_HALF_WIDTH = float(os.getenv("EARLY_EXIT_CI_HALF_WIDTH", "0.05"))
+EARLY_EXIT_SPRT_DELTA = float(os.getenv("EARLY_EXIT_SPRT_DELTA", "0.2"))
+EARLY_EXIT_SPRT_ALPHA = float(os.getenv("EARLY_EXIT_SPRT_ALPHA", "0.01"))
+EARLY_EXIT_SPRT_BETA = float(os.getenv("EARLY_EXIT_SPRT_BETA", "0.01"))
+
+RULES = ("off", "ci", "sprt")
+
+frames_used = metrics.registry.histogram(
+    "cognicare_video_frames_used",
+    "Sharp frames the video prediction was based on",
+    ("rule",),
+    buckets=(8, 16, 32, 64, 96, 128, 160, 192, 224, 250),
+)
+
+
+class ConfidenceIntervalRule:
+    def __init__(self, min_frames: int, z: float, half_width: float) -> None:
+        self.min_frames = min_frames
+        self.z = z
+        self.half_width = half_width
+
+    def should_stop(self, predictions: np.ndarray) -> bool:
+        n = len(predictions)
+        if n < max(2, self.min_frames):
+            return False
+        positive = predictions[:, 1]
+        mean = float(np.mean(positive))
+        margin = self.z * float(np.std(positive, ddof=1)) / math.sqrt(n)
+        return margin <= self.half_width and (mean - margin > 0.5 or mean + margin < 0.5)
+
+    def describe(self) -> str:
+        return f"ci-{self.min_frames}-{self.z}-{self.half_width}"
+
+
+class SequentialTestRule:
+    def __init__(self, min_frames: int, delta: float, alpha: float, beta: float) -> None:
+        self.min_frames = min_frames
+        self.delta = delta
+        self.alpha = alpha
+        self.beta = beta
+        high, low = 0.5 + delta, 0.5 - delta
+        # Log-likelihood ratio added by one "Autistic" / one "Non_Autistic" vote
+        self._vote_for = math.log(high / low)
+        self._vote_against = math.log((1 - high) / (1 - low))
+        self._upper = math.log((1 - beta) / alpha)
+        self._lower = math.log(beta / (1 - alpha))
+
+    def should_stop(self, predictions: np.ndarray) -> bool:
+        n = len(predictions)
+        if n < self.min_frames:
+            return False
+        votes = int(np.count_nonzero(np.argmax(predictions, axis=1) == 1))
+        ratio = votes * self._vote_for + (n - votes) * self._vote_against
+        return ratio >= self._upper or ratio <= self._lower
+
+    def describe(self) -> str:
+        return f"sprt-{self.min_frames}-{self.delta}-{self.alpha}-{self.beta}"
+
+
+def make_rule(name: str, min_frames: int = EARLY_EXIT_MIN_FRAMES):
+    """The stopping rule called ``name`` with the configured parameters; None for "off"."""
+    if name == "off":
+        return None
+    if name == "ci":
+        return ConfidenceIntervalRule(min_frames, EARLY_EXIT_CI_Z, EARLY_EXIT_CI_HALF_WIDTH)
+    if name == "sprt":
+        return SequentialTestRule(min_frames, EARLY_EXIT_SPRT_DELTA, EARLY_EXIT_SPRT_ALPHA, EARLY_EXIT_SPRT_BETA)
+    raise RuntimeError(f"Unknown VIDEO_EARLY_EXIT {name!r}; expected one of {', '.join(RULES)}.")
+
+
+def frames_to_decision(predictions: np.ndarray, rule, chunk_frames: int = EARLY_EXIT_CHUNK_FRAMES) -> int:
+    """How many of ``predictions`` a progressive run would have used, checking after every chunk."""
+    n = len(predictions)
+    for end in range(chunk_frames, n, chunk_frames):
+        if rule.should_stop(predictions[:end]):
+            return end
+    return n
+
+
+class ProgressiveResult(NamedTuple):
+    predictions: np.ndarray
+    gaze_flags: List[bool]
+    frames_used: int
+    stopped_early: bool
+
+
+async def run_progressive(
+    chunks: AsyncIterator[Tuple[np.ndarray, List[bool]]],
+    predict: Callable[[np.ndarray], Awaitable[np.ndarray]],
+    rule,
+    chunk_frames: int = EARLY_EXIT_CHUNK_FRAMES,
+) -> ProgressiveResult:
+    """Predict frames from ``chunks`` until ``rule`` is satisfied or the frames run out.
+
+    Frames are regrouped into chunks of exactly ``chunk_frames``, so where the rule
+    is checked does not depend on how fast decoding happened to run and the
+    outcome matches ``frames_to_decision`` on the same frames. ``chunks`` is
+    closed on return, which stops its decode.
+    """
+    predictions: List[np.ndarray] = []
+    gaze_flags: List[bool] = []
+    buffered: List[np.ndarray] = []
+    buffered_count = 0
+    seen = 0
+
+    async def predict_buffered(count: int) -> bool:
+        nonlocal buffered, buffered_count, seen
+        frames = np.concatenate(buffered) if len(buffered) > 1 else buffered[0]
+        chunk, rest = frames[:count], frames[count:]
+        buffered, buffered_count = ([rest] if len(rest) else []), len(rest)
+        predictions.append(np.asarray(await predict(chunk)))
+        seen += len(chunk)
+        return rule.should_stop(np.concatenate(predictions))
+
+    try:
+        async for frames, flags in chunks:
+            buffered.append(frames)
+            buffered_count += len(frames)
+            gaze_flags.extend(flags)
+            while buffered_count >= chunk_frames:
+                if await predict_buffered(chunk_frames):
+                    return ProgressiveResult(np.concatenate(predictions), gaze_flags[:seen], seen, True)
+        if buffered_count:
+            await predict_buffered(buffered_count)
+    finally:
+        await chunks.aclose()
+
+    combined = np.concatenate(predictions) if predictions else np.empty((0, 2), dtype=np.float32)
+    return ProgressiveResult(combined, gaze_flags[:seen], seen, False)
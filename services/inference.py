@@ -0,0 +1,215 @@
+import asyncio
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from image import FRAME_SHAPE, SharpFrames
+from services import metrics
+
+# Recent batch/request latencies kept for percentile metrics
+_LATENCY_WINDOW = 1024
+
+
+class _Request:
+    """One caller's frames, split across however many batches they land in."""
+
+    def __init__(self, total: int, future: asyncio.Future, model: Any = None) -> None:
+        self.total = total
+        self.future = future
+        # The model every batch holding this request's frames runs on
+        self.model = model
+        self.outputs: List[Tuple[int, np.ndarray]] = []
+        self.remaining = total
+        self.enqueued_at = time.perf_counter()
+
+    def add(self, offset: int, predictions: np.ndarray) -> None:
+        self.outputs.append((offset, predictions))
+        self.remaining -= len(predictions)
+        if self.remaining == 0 and not self.future.done():
+            self.outputs.sort(key=lambda item: item[0])
+            self.future.set_result(np.concatenate([preds for _, preds in self.outputs]))
+
+    def fail(self, exc: BaseException) -> None:
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class _Chunk:
+    def __init__(self, request: _Request, frames: np.ndarray, offset: int) -> None:
+        self.request = request
+        self.frames = frames
+        self.offset = offset
+
+
+class BatchingScheduler:
+    """Merge frames from concurrent requests into fixed-size model batches.
+
+    A batch is dispatched once it holds ``batch_size`` frames or ``max_wait_ms``
+    after its first frame arrived, whichever comes first. Partial batches are
+    zero-padded so the model always sees the same input shape. Batches run one
+    at a time on a dedicated thread, so requests no longer compete for TF threads.
+    A batch only mixes requests pinned to the same model, so a request that
+    started before a hot-swap finishes on the model it started with.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[np.ndarray, Any], np.ndarray],
+        batch_size: int = 32,
+        max_wait_ms: float = 10.0,
+        queue_depth: int = 64,
+    ) -> None:
+        self.run_batch = run_batch
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue_depth = queue_depth
+        self._queue: Optional[asyncio.Queue] = None
+        self._carry: Deque[_Chunk] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="video-infer")
+        self._buffer = np.empty((batch_size, *FRAME_SHAPE), dtype=np.float32)
+
+        self.batches = 0
+        self.frames = 0
+        self.padded_frames = 0
+        self._batch_latency: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._request_latency: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.queue_depth)
+            self._carry.clear()
+            # A fresh context, so the dispatcher does not inherit the first caller's trace
+            self._task = loop.create_task(self._dispatch_loop(), context=contextvars.Context())
+
+    async def predict(self, frames, model: Any = None) -> np.ndarray:
+        """Return per-frame predictions for ``frames`` (SharpFrames or an array) from ``model``."""
+        self._ensure_started()
+        parts = frames.parts if isinstance(frames, SharpFrames) else [np.asarray(frames)]
+        total = sum(len(part) for part in parts)
+        if total == 0:
+            raise HTTPException(status_code=400, detail="Input data is empty")
+
+        request = _Request(total, self._loop.create_future(), model)
+        offset = 0
+        try:
+            for part in parts:
+                for start in range(0, len(part), self.batch_size):
+                    chunk = part[start:start + self.batch_size]
+                    # Blocks while the queue is full, pushing back on new uploads
+                    await self._queue.put(_Chunk(request, chunk, offset))
+                    offset += len(chunk)
+            result = await request.future
+        except BaseException:
+            # Chunks still queued for this request are skipped by the dispatcher
+            request.future.cancel()
+            raise
+        self._request_latency.append(time.perf_counter() - request.enqueued_at)
+        return result
+
+    async def _next_chunk(self, timeout: Optional[float]) -> Optional[_Chunk]:
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            if self._carry:
+                chunk = self._carry.popleft()
+            elif deadline is None:
+                chunk = await self._queue.get()
+            else:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    chunk = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+            # Skip frames of requests that already failed or were cancelled
+            if not chunk.request.future.done():
+                return chunk
+
+    async def _dispatch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await self._next_chunk(None)
+            deadline = loop.time() + self.max_wait
+            slices = []
+            filled = 0
+            while chunk is not None:
+                if slices and chunk.request.model is not slices[0][0].request.model:
+                    # Frames for another model version open the next batch
+                    self._carry.appendleft(chunk)
+                    break
+                take = min(self.batch_size - filled, len(chunk.frames))
+                slices.append((chunk, take))
+                filled += take
+                if take < len(chunk.frames):
+                    # The rest of this chunk opens the next batch
+                    self._carry.appendleft(_Chunk(chunk.request, chunk.frames[take:], chunk.offset + take))
+                if filled == self.batch_size:
+                    break
+                chunk = await self._next_chunk(deadline - loop.time())
+            await self._run(slices, filled)
+
+    async def _run(self, slices, filled: int) -> None:
+        batch = self._buffer
+        position = 0
+        for chunk, take in slices:
+            frames = chunk.frames[:take]
+            if frames.dtype == np.uint8:
+                np.divide(frames, np.float32(255.0), out=batch[position:position + take], dtype=np.float32)
+            else:
+                batch[position:position + take] = frames
+            position += take
+        batch[filled:] = 0.0
+
+        started = time.perf_counter()
+        try:
+            predictions = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.run_batch, batch, slices[0][0].request.model,
+            )
+        except BaseException as exc:
+            for chunk, _ in slices:
+                chunk.request.fail(exc)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            return
+        elapsed = time.perf_counter() - started
+        self._batch_latency.append(elapsed)
+        metrics.observe_stage("inference", elapsed)
+        self.batches += 1
+        self.frames += filled
+        self.padded_frames += self.batch_size - filled
+
+        predictions = np.asarray(predictions)
+        position = 0
+        for chunk, take in slices:
+            chunk.request.add(chunk.offset, predictions[position:position + take])
+            position += take
+
+    def metrics(self) -> dict:
+        def percentiles(samples: Deque[float]) -> dict:
+            if not samples:
+                return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+            values = np.percentile(np.fromiter(samples, dtype=float), [50, 95, 99]) * 1000
+            return {"p50_ms": float(values[0]), "p95_ms": float(values[1]), "p99_ms": float(values[2])}
+
+        slots = self.frames + self.padded_frames
+        return {
+            "batch_size": self.batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self.queue_depth,
+            "queued_chunks": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "frames": self.frames,
+            "batch_fill": self.frames / slots if slots else None,
+            "batch_latency": percentiles(self._batch_latency),
+            "request_latency": percentiles(self._request_latency),
+        }
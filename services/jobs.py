@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import SessionLocal
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# Uploaded videos wait here until a worker picks the job up
+JOB_STORAGE_DIR = os.getenv("JOB_STORAGE_DIR", "videos/jobs")
+
+JobHandler = Callable[[AsyncSession, models.PredictionJob], Awaitable[dict]]
+
+
+async def enqueue_job(
+    db: AsyncSession,
+    email: str,
+    form_input: dict,
+    video_path: Optional[str],
+    video_hash: Optional[str] = None,
+) -> models.PredictionJob:
+    job = models.PredictionJob(
+        id=uuid.uuid4().hex,
+        user_email=email,
+        status=JOB_QUEUED,
+        form_input=json.dumps(form_input),
+        video_path=video_path,
+        video_hash=video_hash,
+        attempts=0,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+class JobWorkerPool:
+    """Background workers draining the ``prediction_jobs`` table.
+
+    Jobs are claimed with a conditional UPDATE, so several app processes can share
+    one table without running a job twice. A running job's ``updated_at`` is
+    refreshed every ``heartbeat_seconds``, so jobs left ``running`` by a crashed
+    process are told apart from slow ones and requeued once they have not been
+    touched for ``stale_after``.
+    """
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        workers: int = 2,
+        poll_seconds: float = 1.0,
+        stale_after: timedelta = timedelta(minutes=30),
+        heartbeat_seconds: Optional[float] = None,
+    ) -> None:
+        self.handler = handler
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.stale_after = stale_after
+        # Several beats fit in stale_after, so one slow or failed beat does not requeue the job
+        self.heartbeat_seconds = heartbeat_seconds or stale_after.total_seconds() / 4
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        os.makedirs(JOB_STORAGE_DIR, exist_ok=True)
+        self._wakeup = asyncio.Event()
+        await self._requeue_stale()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        """Tell idle workers a job was just queued instead of waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _requeue_stale(self) -> None:
+        cutoff = datetime.now(timezone.utc) - self.stale_after
+        async with SessionLocal() as db:
+            await db.execute(
+                update(models.PredictionJob)
+                .where(models.PredictionJob.status == JOB_RUNNING, models.PredictionJob.updated_at < cutoff)
+                .values(status=JOB_QUEUED)
+            )
+            await db.commit()
+
+    async def _claim(self, db: AsyncSession) -> Optional[models.PredictionJob]:
+        candidates = (await db.execute(
+            select(models.PredictionJob.id)
+            .where(models.PredictionJob.status == JOB_QUEUED)
+            .order_by(models.PredictionJob.created_at)
+            .limit(self.workers)
+        )).scalars().all()
+        for job_id in candidates:
+            claimed = await db.execute(
+                update(models.PredictionJob)
+                .where(models.PredictionJob.id == job_id, models.PredictionJob.status == JOB_QUEUED)
+                .values(status=JOB_RUNNING, attempts=models.PredictionJob.attempts + 1)
+            )
+            await db.commit()
+            if claimed.rowcount:
+                return await db.get(models.PredictionJob, job_id)
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                async with SessionLocal() as db:
+                    job = await self._claim(db)
+                    if job is not None:
+                        await self._execute(db, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                print(f"⚠️ Job worker error: {exc}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                # A session of its own; the handler is using the job's
+                async with SessionLocal() as db:
+                    await db.execute(
+                        update(models.PredictionJob)
+                        .where(models.PredictionJob.id == job_id, models.PredictionJob.status == JOB_RUNNING)
+                        .values(updated_at=func.now())
+                    )
+                    await db.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                print(f"⚠️ Job heartbeat failed: {exc}")
+
+    async def _execute(self, db: AsyncSession, job: models.PredictionJob) -> None:
+        job_id = job.id
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await self.handler(db, job)
+        except Exception as exc:
+            await db.rollback()
+            # The rollback expired ``job``; loading it again would need I/O outside an await,
+            # so the failure is written by id in a transaction of its own
+            await db.execute(
+                update(models.PredictionJob)
+                .where(models.PredictionJob.id == job_id)
+                .values(status=JOB_FAILED, error=str(getattr(exc, "detail", None) or exc))
+            )
+        else:
+            job.status = JOB_SUCCEEDED
+            job.result = json.dumps(result)
+        finally:
+            heartbeat.cancel()
+        await db.commit()
@@ -0,0 +1,354 @@
+"""A small Prometheus-style metrics registry, request tracing and a sampling profiler.
+
+Only the text exposition format is implemented; nothing here depends on the rest
+of the app, so any module can record into it.
+"""
+import asyncio
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _Tally, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Log a per-request stage breakdown for this fraction of requests (1.0 = all)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Requests carrying this header are always traced, under the caller's id
+TRACE_HEADER = os.getenv("TRACE_HEADER", "x-request-id").lower()
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., +Inf count], sum
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class GaugeFunc:
+    """A gauge read from ``fn`` at scrape time; ``fn`` returns a number or {label value: number}."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        fn: Callable[[], Union[float, Dict[str, float], None]],
+        labelname: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelname = labelname
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        if isinstance(value, dict):
+            for label, item in sorted(value.items()):
+                if item is not None:
+                    lines.append(f"{self.name}{_format_labels((self.labelname,), (label,))} {_format_value(item)}")
+        elif value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. on module reload) keeps the first instance
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, fn, labelname: Optional[str] = None) -> GaugeFunc:
+        with self._lock:
+            # Callback gauges are replaced, so the latest owner of the name is read
+            self._metrics[name] = GaugeFunc(name, documentation, fn, labelname)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "cognicare_stage_seconds",
+    "Time spent per pipeline stage (decode/blur/cascade/resize are summed over a video's frames)",
+    ("stage",),
+)
+frames_read = registry.counter("cognicare_video_frames_read_total", "Video frames decoded")
+frames_kept = registry.counter("cognicare_video_frames_kept_total", "Sharp video frames kept for inference")
+reports = registry.counter("cognicare_reports_total", "Reports generated, by source", ("source",))
+http_requests = registry.histogram(
+    "cognicare_http_request_seconds", "HTTP request latency", ("method", "route", "status"),
+)
+loop_lag = registry.histogram(
+    "cognicare_event_loop_lag_seconds",
+    "How late the event loop woke up for a scheduled callback",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+# --- tracing ---
+
+_trace: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("cognicare_trace", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace["id"] if trace is not None else None
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record ``seconds`` for ``stage``, and add it to the current request's trace if one is active."""
+    if not METRICS_ENABLED:
+        return
+    stage_seconds.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace["stages"][stage] += seconds
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """Time every HTTP request and, for sampled or tagged requests, log a stage breakdown."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self._sampled = 0.0
+
+    def _should_sample(self) -> bool:
+        if TRACE_SAMPLE_RATE <= 0:
+            return False
+        # Deterministic 1-in-N sampling; no random state shared between requests
+        self._sampled += TRACE_SAMPLE_RATE
+        if self._sampled >= 1.0:
+            self._sampled -= 1.0
+            return True
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = None
+        for name, value in scope.get("headers", []):
+            if name == TRACE_HEADER.encode("latin-1"):
+                trace_id = value.decode("latin-1")[:64]
+                break
+        if trace_id is None and self._should_sample():
+            trace_id = uuid.uuid4().hex
+        token = _trace.set({"id": trace_id, "stages": defaultdict(float)}) if trace_id else None
+
+        status = 500
+        started = time.perf_counter()
+
+        async def traced_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace_id:
+                    message = dict(message, headers=list(message.get("headers", [])) + [
+                        (b"x-trace-id", trace_id.encode("latin-1")),
+                    ])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_requests.observe(elapsed, method=scope["method"], route=route, status=status)
+            if token is not None:
+                stages = _trace.get()["stages"]
+                _trace.reset(token)
+                breakdown = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stages.items())
+                print(f"🔎 trace {trace_id} {scope['method']} {route} {status} {elapsed * 1000:.1f}ms {breakdown}")
+
+
+class EventLoopMonitor:
+    """Measures event-loop lag by timing a periodic sleep."""
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - expected)
+            loop_lag.observe(self.last_lag)
+
+
+def instrument_engine(sync_engine) -> None:
+    """Time every SQL statement as the ``db`` stage."""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("cognicare_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("cognicare_query_start")
+        if starts:
+            observe_stage("db", time.perf_counter() - starts.pop())
+
+
+# --- sampling profiler ---
+
+class SamplingProfiler:
+    """Samples the stacks of every thread and aggregates them as collapsed stacks.
+
+    The output is the "folded" format read by flamegraph.pl and speedscope.
+    Only one profile runs at a time.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def run(self, seconds: float, interval: float = 0.01) -> Optional[str]:
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            own = threading.get_ident()
+            tally: _Tally = _Tally()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    tally[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            return "".join(f"{stack} {count}\n" for stack, count in tally.most_common())
+        finally:
+            self._lock.release()
+
+
+profiler = SamplingProfiler()
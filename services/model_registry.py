@@ -0,0 +1,190 @@
+"""Versioned model artefacts with atomic hot-swap.
+
+Artefacts live under ``MODEL_REGISTRY_DIR/<name>/<version>/<filename>``. The
+active version is named in ``MODEL_REGISTRY_DIR/<name>/CURRENT``, or is the
+highest version directory when there is no such file. A model without a
+registry directory falls back to its legacy single-file path, versioned by
+the file's mtime and size, so replacing that file also triggers a swap.
+
+A new version is loaded and warmed up next to the old one and then swapped in
+with a single reference assignment. Requests hold the ``LoadedModel`` they
+started with, so in-flight work finishes on the old version.
+"""
+import asyncio
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+
+MODEL_REGISTRY_DIR = Path(os.getenv("MODEL_REGISTRY_DIR", "ml_models"))
+# How often every worker checks for a new active version
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "5"))
+
+_CURRENT_FILE = "CURRENT"
+
+
+class LoadedModel(NamedTuple):
+    name: str
+    version: str
+    path: Path
+    model: Any
+
+
+def _version_key(version: str):
+    # "v10" sorts after "v9"
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version)]
+
+
+class ModelSlot:
+    def __init__(
+        self,
+        name: str,
+        filename: str,
+        legacy_path: Path,
+        loader: Callable[[Path], Any],
+        warm_up: Optional[Callable[[Any], None]] = None,
+        root: Path = MODEL_REGISTRY_DIR,
+    ) -> None:
+        self.name = name
+        self.filename = filename
+        self.legacy_path = Path(legacy_path)
+        self.loader = loader
+        self.warm_up = warm_up
+        self.directory = Path(root) / name
+        self._loaded: Optional[LoadedModel] = None
+        self._lock = threading.Lock()
+
+    def versions(self) -> List[str]:
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (entry.name for entry in self.directory.iterdir() if (entry / self.filename).exists()),
+            key=_version_key,
+        )
+
+    def resolve(self) -> Optional[Tuple[str, Path]]:
+        """(version, path) that should be active now, or None if there is no artefact."""
+        if self.directory.is_dir():
+            pointer = self.directory / _CURRENT_FILE
+            if pointer.exists():
+                version = pointer.read_text().strip()
+            else:
+                versions = self.versions()
+                version = versions[-1] if versions else None
+            if version:
+                path = self.directory / version / self.filename
+                if path.exists():
+                    return version, path
+        if self.legacy_path.exists():
+            stat = self.legacy_path.stat()
+            return f"file-{stat.st_mtime_ns}-{stat.st_size}", self.legacy_path
+        return None
+
+    def peek(self) -> Optional[LoadedModel]:
+        return self._loaded
+
+    def get(self) -> LoadedModel:
+        """The active model, loading it on first use. Blocks, so call it off the event loop."""
+        loaded = self._loaded
+        if loaded is None:
+            self.refresh()
+            loaded = self._loaded
+            if loaded is None:
+                raise HTTPException(status_code=503, detail=f"{self.name} model is not available.")
+        return loaded
+
+    def refresh(self) -> bool:
+        """Load the active version if it is not the one being served; True if a swap happened."""
+        with self._lock:
+            target = self.resolve()
+            if target is None:
+                return False
+            version, path = target
+            if self._loaded is not None and self._loaded.version == version:
+                return False
+            model = self.loader(path)
+            if self.warm_up is not None:
+                self.warm_up(model)
+            previous = self._loaded
+            self._loaded = LoadedModel(self.name, version, path, model)
+        if previous is not None:
+            print(f"🔁 {self.name} model swapped from {previous.version} to {version}")
+        return True
+
+    def activate(self, version: str) -> bool:
+        """Point CURRENT at ``version`` (seen by every worker) and swap to it here."""
+        if version not in self.versions():
+            raise HTTPException(status_code=404, detail=f"Unknown {self.name} model version {version!r}")
+        pointer = self.directory / _CURRENT_FILE
+        tmp = pointer.with_name(f".{_CURRENT_FILE}.{os.getpid()}")
+        tmp.write_text(version)
+        os.replace(tmp, pointer)
+        return self.refresh()
+
+
+class ModelRegistry:
+    def __init__(self, watch_seconds: float = MODEL_WATCH_SECONDS) -> None:
+        self.watch_seconds = watch_seconds
+        self._slots: Dict[str, ModelSlot] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, slot: ModelSlot) -> ModelSlot:
+        self._slots[slot.name] = slot
+        return slot
+
+    def slot(self, name: str) -> ModelSlot:
+        slot = self._slots.get(name)
+        if slot is None:
+            raise HTTPException(status_code=404, detail=f"Unknown model {name!r}")
+        return slot
+
+    def get(self, name: str) -> LoadedModel:
+        return self.slot(name).get()
+
+    def preload(self, names) -> None:
+        """Load models before the server forks its workers, so they share the pages."""
+        for name in names:
+            try:
+                self.slot(name).refresh()
+            except Exception as exc:
+                print(f"⚠️ Could not preload {name} model: {getattr(exc, 'detail', exc)}")
+
+    def describe(self) -> dict:
+        described = {}
+        for name, slot in self._slots.items():
+            loaded = slot.peek()
+            described[name] = {
+                "active": loaded.version if loaded else None,
+                "path": str(loaded.path) if loaded else None,
+                "versions": slot.versions(),
+            }
+        return described
+
+    async def start(self) -> None:
+        if self._task is None and self.watch_seconds > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.watch_seconds)
+            for slot in list(self._slots.values()):
+                # Only models already in use are swapped; the rest load on first use
+                if slot.peek() is None:
+                    continue
+                try:
+                    await asyncio.to_thread(slot.refresh)
+                except Exception as exc:
+                    # Keep serving the current version
+                    print(f"⚠️ {slot.name} model reload failed: {getattr(exc, 'detail', exc)}")
+
+
+model_registry = ModelRegistry()
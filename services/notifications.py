@@ -1,32 +1,178 @@
-from typing import Dict, List
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
 
 from fastapi import WebSocket
 
+from services.pubsub import create_backend
+
+# Events waiting to be sent to one socket; a client this far behind is disconnected
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "32"))
+NOTIFY_HEARTBEAT_SECONDS = float(os.getenv("NOTIFY_HEARTBEAT_SECONDS", "20"))
+NOTIFY_SEND_TIMEOUT_SECONDS = float(os.getenv("NOTIFY_SEND_TIMEOUT_SECONDS", "10"))
+# Recent events kept per email so a reconnecting client can catch up
+NOTIFY_BUFFER_SIZE = int(os.getenv("NOTIFY_BUFFER_SIZE", "50"))
+NOTIFY_BUFFER_TTL_SECONDS = float(os.getenv("NOTIFY_BUFFER_TTL_SECONDS", "3600"))
+NOTIFY_BUFFER_EMAILS = int(os.getenv("NOTIFY_BUFFER_EMAILS", "10000"))
+
+# WebSocket close code 1013 ("try again later") tells the client to reconnect
+_SLOW_CONSUMER_CODE = 1013
+
+
+class _Subscriber:
+    """One socket with its own bounded queue, drained by a sender task."""
+
+    def __init__(self, websocket: WebSocket, queue_size: int, heartbeat_seconds: float) -> None:
+        self.websocket = websocket
+        self.heartbeat_seconds = heartbeat_seconds
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.closing: Optional[asyncio.Task] = None
+
+    def offer(self, event: dict) -> bool:
+        """Queue ``event`` without waiting; False means the client has fallen too far behind."""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def run(self) -> None:
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    event = {"type": "ping", "timestamp": time.time()}
+                await asyncio.wait_for(self.websocket.send_json(event), NOTIFY_SEND_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Dead or stalled connection; closing it ends the endpoint's receive loop
+            await self.close()
+
+    async def close(self, code: int = 1000) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def drop(self, code: int) -> None:
+        """Discard queued events and close the socket in the background.
+
+        The close handshake can take as long as the client's stalled reads, so
+        nothing on the delivery path waits for it.
+        """
+        self.queue = asyncio.Queue(maxsize=1)
+        if self.closing is None:
+            self.closing = asyncio.create_task(self.close(code=code))
+
 
 class NotificationManager:
-    def __init__(self) -> None:
-        self._connections: Dict[str, List[WebSocket]] = {}
+    """Sockets connected to this worker, fed by a pub/sub backend shared by all workers.
 
-    async def connect(self, email: str, websocket: WebSocket) -> None:
-        await websocket.accept()
-        self._connections.setdefault(email, []).append(websocket)
+    Every worker sees every published event, so each keeps a short per-email
+    history and can replay it to a client reconnecting with ``last_event_id``.
+    """
 
-    def disconnect(self, email: str, websocket: WebSocket) -> None:
+    def __init__(self, backend=None) -> None:
+        self._connections: Dict[str, List[_Subscriber]] = {}
+        self._history: "OrderedDict[str, Deque[Tuple[float, dict]]]" = OrderedDict()
+        self._last_event_id = 0
+        self.backend = backend if backend is not None else create_backend()
+
+    async def start(self) -> None:
+        await self.backend.start(self._deliver)
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+        for subscribers in list(self._connections.values()):
+            for subscriber in subscribers:
+                if subscriber.task is not None:
+                    subscriber.task.cancel()
+        self._connections.clear()
+
+    async def connect(
+        self,
+        email: str,
+        websocket: WebSocket,
+        last_event_id: Optional[int] = None,
+        subprotocol: Optional[str] = None,
+    ) -> _Subscriber:
+        """Accept the socket of an already authenticated ``email``."""
+        await websocket.accept(subprotocol=subprotocol)
+        subscriber = _Subscriber(websocket, NOTIFY_QUEUE_SIZE, NOTIFY_HEARTBEAT_SECONDS)
+        if last_event_id is not None:
+            for event in self._replay(email, last_event_id):
+                if not subscriber.offer(event):
+                    break
+        # No await between replay and registration, so no event is missed or sent twice
+        self._connections.setdefault(email, []).append(subscriber)
+        subscriber.task = asyncio.create_task(subscriber.run())
+        return subscriber
+
+    def disconnect(self, email: str, subscriber: _Subscriber) -> None:
+        if subscriber.task is not None:
+            subscriber.task.cancel()
         connections = self._connections.get(email)
         if not connections:
             return
-        if websocket in connections:
-            connections.remove(websocket)
+        if subscriber in connections:
+            connections.remove(subscriber)
         if not connections:
             self._connections.pop(email, None)
 
+    def connection_counts(self) -> dict:
+        """Open sockets and distinct users on this worker."""
+        return {
+            "sockets": sum(len(subscribers) for subscribers in self._connections.values()),
+            "users": len(self._connections),
+        }
+
+    def _next_event_id(self) -> int:
+        # Microsecond timestamps keep ids ordered across workers on one clock
+        self._last_event_id = max(self._last_event_id + 1, time.time_ns() // 1000)
+        return self._last_event_id
+
     async def notify_report_ready(self, *, email: str, payload: dict) -> None:
-        connections = self._connections.get(email, [])
-        for websocket in list(connections):
-            try:
-                await websocket.send_json(payload)
-            except Exception:
-                self.disconnect(email, websocket)
+        """Publish ``payload`` for ``email``; the worker holding the socket delivers it."""
+        event = dict(payload, event_id=self._next_event_id())
+        try:
+            await self.backend.publish({"email": email, "payload": event})
+        except Exception as exc:
+            # The record and report are already stored; a lost push only costs the live update
+            print(f"⚠️ Failed to publish notification: {exc}")
+
+    def _remember(self, email: str, event: dict) -> None:
+        history = self._history.get(email)
+        if history is None:
+            history = self._history[email] = deque(maxlen=NOTIFY_BUFFER_SIZE)
+            while len(self._history) > NOTIFY_BUFFER_EMAILS:
+                self._history.popitem(last=False)
+        self._history.move_to_end(email)
+        history.append((time.monotonic(), event))
+
+    def _replay(self, email: str, last_event_id: int) -> List[dict]:
+        cutoff = time.monotonic() - NOTIFY_BUFFER_TTL_SECONDS
+        history = self._history.get(email, ())
+        return [
+            event for stored_at, event in history
+            if stored_at > cutoff and event.get("event_id", 0) > last_event_id
+        ]
+
+    async def _deliver(self, message: dict) -> None:
+        email = message.get("email")
+        event = message.get("payload")
+        if email is None or event is None:
+            return
+        self._remember(email, event)
+        for subscriber in list(self._connections.get(email, [])):
+            if not subscriber.offer(event):
+                # Never let one slow client hold up the rest; it can reconnect and replay
+                self.disconnect(email, subscriber)
+                subscriber.drop(_SLOW_CONSUMER_CODE)
 
 
 notification_manager = NotificationManager()
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Optional, Set
+
+import asyncpg
+from sqlalchemy import text
+
+from database import SQLALCHEMY_DATABASE_URL, engine
+
+# "memory" keeps events inside this process; "postgres" fans them out to every worker
+NOTIFY_BACKEND = os.getenv("NOTIFY_BACKEND", "memory").lower()
+NOTIFY_CHANNEL = os.getenv("NOTIFY_CHANNEL", "cognicare_notifications")
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+_MAX_NOTIFY_BYTES = 7900
+
+MessageHandler = Callable[[dict], Awaitable[None]]
+
+
+class InMemoryBackend:
+    """Delivers published messages straight back to this process."""
+
+    def __init__(self) -> None:
+        self._handler: Optional[MessageHandler] = None
+
+    async def start(self, handler: MessageHandler) -> None:
+        self._handler = handler
+
+    async def stop(self) -> None:
+        self._handler = None
+
+    async def publish(self, message: dict) -> None:
+        if self._handler is not None:
+            await self._handler(message)
+
+
+class PostgresBackend:
+    """Fan-out through Postgres LISTEN/NOTIFY.
+
+    Every worker keeps one dedicated asyncpg connection listening on ``channel``
+    and publishes through the shared engine, so whichever worker holds the
+    recipient's socket delivers the message, including the publisher itself.
+    """
+
+    def __init__(self, dsn: str, channel: str = NOTIFY_CHANNEL, reconnect_seconds: float = 2.0) -> None:
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_seconds = reconnect_seconds
+        self._handler: Optional[MessageHandler] = None
+        self._task: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+
+    async def start(self, handler: MessageHandler) -> None:
+        self._handler = handler
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._handler = None
+
+    async def publish(self, message: dict) -> None:
+        payload = json.dumps(message)
+        if len(payload.encode("utf-8")) > _MAX_NOTIFY_BYTES:
+            # Too big for NOTIFY; sockets on this worker still get it
+            print(f"⚠️ Notification too large for {self.channel}, delivering locally only")
+            if self._handler is not None:
+                await self._handler(message)
+            return
+        async with engine.begin() as conn:
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+
+    async def _listen(self) -> None:
+        while True:
+            closed = asyncio.Event()
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                conn.add_termination_listener(lambda _conn: closed.set())
+                await conn.add_listener(self.channel, self._on_notify)
+                await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                print(f"⚠️ Notification listener error: {exc}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(self.reconnect_seconds)
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str) -> None:
+        if self._handler is None:
+            return
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        task = asyncio.get_running_loop().create_task(self._handler(message))
+        # Hold a reference until delivery finishes so the task is not garbage collected
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+
+def _asyncpg_dsn(url: str) -> str:
+    """asyncpg takes a plain ``postgresql://`` DSN without a SQLAlchemy driver suffix."""
+    scheme, sep, rest = url.partition("://")
+    return f"postgresql{sep}{rest}"
+
+
+def create_backend(name: str = NOTIFY_BACKEND):
+    if name == "memory":
+        return InMemoryBackend()
+    if name == "postgres":
+        if not SQLALCHEMY_DATABASE_URL.startswith("postgres"):
+            raise RuntimeError("NOTIFY_BACKEND=postgres requires a PostgreSQL DATABASE_URL.")
+        return PostgresBackend(_asyncpg_dsn(SQLALCHEMY_DATABASE_URL))
+    raise RuntimeError(f"Unknown NOTIFY_BACKEND {name!r}; expected 'memory' or 'postgres'.")
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+REPORT_CACHE_ENABLED = os.getenv("REPORT_CACHE_ENABLED", "true").lower() == "true"
+# Confidences are rounded to this many percentage points before prompting and keying,
+# so assessments that differ only in noise share one report
+REPORT_CACHE_PRECISION = float(os.getenv("REPORT_CACHE_PRECISION", "5"))
+REPORT_CACHE_TTL = timedelta(seconds=float(os.getenv("REPORT_CACHE_TTL_SECONDS", str(7 * 24 * 3600))))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "10000"))
+
+
+def bucket(value: Optional[float], precision: float) -> Optional[float]:
+    if value is None or precision <= 0:
+        return value
+    return round(value / precision) * precision
+
+
+def cache_key(prompt: str, model: str, max_words: int) -> str:
+    normalised = re.sub(r"\s+", " ", prompt.strip().lower())
+    return hashlib.sha256(f"{model}|{max_words}|{normalised}".encode("utf-8")).hexdigest()
+
+
+async def get_cached_report(db: AsyncSession, key: str) -> Optional[str]:
+    now = datetime.now(timezone.utc)
+    entry = await db.get(models.ReportCache, key)
+    if entry is None:
+        return None
+    if _as_utc(entry.expires_at) <= now:
+        await db.delete(entry)
+        await db.commit()
+        return None
+    entry.hits = (entry.hits or 0) + 1
+    entry.last_used_at = now
+    await db.commit()
+    return entry.report_text
+
+
+async def store_report(db: AsyncSession, key: str, prompt: str, report_text: str) -> None:
+    now = datetime.now(timezone.utc)
+    try:
+        # A savepoint, so a duplicate only undoes this insert and not the caller's
+        # pending changes (e.g. the job's data_id) in the same session
+        async with db.begin_nested():
+            db.add(models.ReportCache(
+                key=key,
+                prompt=prompt,
+                report_text=report_text,
+                hits=0,
+                created_at=now,
+                last_used_at=now,
+                expires_at=now + REPORT_CACHE_TTL,
+            ))
+    except IntegrityError:
+        # A concurrent request cached the same prompt first
+        return
+    await db.commit()
+    await _evict(db, now)
+
+
+async def _evict(db: AsyncSession, now: datetime) -> None:
+    await db.execute(delete(models.ReportCache).where(models.ReportCache.expires_at <= now))
+    excess = (await db.execute(select(func.count(models.ReportCache.key)))).scalar_one() - REPORT_CACHE_MAX_ENTRIES
+    if excess > 0:
+        oldest = select(models.ReportCache.key).order_by(models.ReportCache.last_used_at).limit(excess)
+        await db.execute(delete(models.ReportCache).where(models.ReportCache.key.in_(oldest)))
+    await db.commit()
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands timestamps back without tzinfo; they were written as UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
@@ -1,24 +1,93 @@
+import asyncio
 import os
+import random
 from typing import Optional
 
+import groq
+import httpx
 from fastapi import HTTPException
-from groq import Groq
-from sqlalchemy.orm import Session
+from groq import AsyncGroq
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import models
+from services import metrics, report_cache
 
-def _client() -> Groq:
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="GROQ_API_KEY environment variable is required.")
-    return Groq(api_key=api_key)
+REPORT_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+# Point the client at a local stub server in tests/benchmarks
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+# Timeout of a single LLM call, and of the whole report including retries and queueing
+REPORT_TIMEOUT_SECONDS = float(os.getenv("REPORT_TIMEOUT_SECONDS", "20"))
+REPORT_DEADLINE_SECONDS = float(os.getenv("REPORT_DEADLINE_SECONDS", "30"))
+REPORT_MAX_CONCURRENCY = int(os.getenv("REPORT_MAX_CONCURRENCY", "8"))
+REPORT_MAX_RETRIES = int(os.getenv("REPORT_MAX_RETRIES", "2"))
+REPORT_BACKOFF_SECONDS = float(os.getenv("REPORT_BACKOFF_SECONDS", "0.5"))
+# Return a templated summary instead of an error when the LLM is slow or failing
+REPORT_FALLBACK = os.getenv("REPORT_FALLBACK", "true").lower() == "true"
 
-def generate_and_store_report(
-    db: Session,
-    record: models.Data,
-    max_words: int = 120,
-    additional_notes: Optional[str] = None,
-) -> str:
+SYSTEM_PROMPT = "You are a compassionate clinician writing brief, easy-to-understand summaries for parents."
+
+_RETRYABLE_ERRORS = (
+    groq.APITimeoutError,
+    groq.APIConnectionError,
+    groq.RateLimitError,
+    groq.InternalServerError,
+)
+
+
+class _ReportClient:
+    """One pooled AsyncGroq client and concurrency limit per event loop."""
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncGroq] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
+                raise HTTPException(status_code=500, detail="GROQ_API_KEY environment variable is required.")
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=REPORT_MAX_CONCURRENCY,
+                    max_keepalive_connections=REPORT_MAX_CONCURRENCY,
+                ),
+                timeout=REPORT_TIMEOUT_SECONDS,
+            )
+            # Retries are handled here, with backoff, rather than by the SDK
+            self._client = AsyncGroq(
+                api_key=api_key,
+                base_url=GROQ_BASE_URL,
+                timeout=REPORT_TIMEOUT_SECONDS,
+                max_retries=0,
+                http_client=http_client,
+            )
+            self._semaphore = asyncio.Semaphore(REPORT_MAX_CONCURRENCY)
+            self._loop = loop
+        return self._client, self._semaphore
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.close()
+        self._client = None
+        self._loop = None
+
+
+_report_client = _ReportClient()
+
+
+async def aclose() -> None:
+    """Close pooled LLM connections; called on application shutdown."""
+    await _report_client.aclose()
+
+
+def build_prompt(record: models.Data, additional_notes: Optional[str] = None, precision: float = 0.0) -> str:
+    """Prompt describing ``record``; a non-zero ``precision`` rounds the confidences to that many points."""
+    video_confidence = report_cache.bucket(record.video_confidence, precision)
+    eye_gaze_percentage = report_cache.bucket(record.eye_gaze_percentage, precision)
+    # form_confidence is a probability, so it is bucketed on its own scale
+    form_confidence = report_cache.bucket(record.form_confidence, precision / 100)
     primary_result = record.video_prediction or record.form_prediction or "Unavailable"
     prediction_kind = "combined" if record.video_prediction and record.form_prediction else (
         "video" if record.video_prediction else "form"
@@ -31,29 +100,64 @@ def generate_and_store_report(
     ]
 
     if record.video_prediction:
-        prompt_parts.append(f"Video outcome: {record.video_prediction} (confidence {record.video_confidence:.2f}%).")
-    if record.eye_gaze_percentage is not None:
-        prompt_parts.append(f"Eye gaze stability: {record.eye_gaze_percentage:.2f}%.")
+        prompt_parts.append(f"Video outcome: {record.video_prediction} (confidence {video_confidence:.2f}%).")
+    if eye_gaze_percentage is not None:
+        prompt_parts.append(f"Eye gaze stability: {eye_gaze_percentage:.2f}%.")
     if record.form_prediction:
-        prompt_parts.append(f"Form assessment: {record.form_prediction} (confidence {record.form_confidence:.2f}%).")
+        if form_confidence is not None:
+            prompt_parts.append(f"Form assessment: {record.form_prediction} (confidence {form_confidence:.2f}%).")
+        else:
+            prompt_parts.append(f"Form assessment: {record.form_prediction}.")
     if additional_notes:
         prompt_parts.append(f"Additional notes: {additional_notes}")
 
-    prompt = " ".join(prompt_parts)
+    return " ".join(prompt_parts)
 
-    client = _client()
-    try:
-        result = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {"role": "system", "content": "You are a compassionate clinician writing brief, easy-to-understand summaries for parents."},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=min(800, max_words * 4),
-            temperature=0.3,
-        )
-    except Exception as exc:
-        raise HTTPException(status_code=502, detail=f"Groq API error: {exc}") from exc
+
+def template_summary(record: models.Data) -> str:
+    """Report used when the LLM cannot answer in time."""
+    parts = ["Thank you for completing the CogniCare screening."]
+    if record.video_prediction:
+        outcome = "signs associated with autism" if record.video_prediction == "Autistic" else "no strong signs associated with autism"
+        parts.append(f"The video analysis showed {outcome} (confidence {record.video_confidence:.0f}%).")
+    if record.eye_gaze_percentage is not None:
+        parts.append(f"Eye contact was detected in {record.eye_gaze_percentage:.0f}% of the clear frames.")
+    if record.form_prediction:
+        outcome = "signs associated with autism" if record.form_prediction == "1" else "no strong signs associated with autism"
+        parts.append(f"The questionnaire answers showed {outcome}.")
+    parts.append(
+        "These results are a screening aid, not a diagnosis. Please share them with your paediatrician "
+        "or a developmental specialist, who can help you decide on next steps."
+    )
+    return " ".join(parts)
+
+
+async def request_summary(prompt: str, max_words: int = 120) -> str:
+    """Ask the LLM for a summary, retrying transient failures with exponential backoff."""
+    client, semaphore = _report_client.get()
+    attempt = 0
+    while True:
+        try:
+            async with semaphore:
+                with metrics.timed("llm"):
+                    result = await client.chat.completions.create(
+                        model=REPORT_MODEL,
+                        messages=[
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt},
+                        ],
+                        max_tokens=min(800, max_words * 4),
+                        temperature=0.3,
+                    )
+            break
+        except _RETRYABLE_ERRORS as exc:
+            if attempt >= REPORT_MAX_RETRIES:
+                raise HTTPException(status_code=502, detail=f"Groq API error: {exc}") from exc
+            delay = REPORT_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+            attempt += 1
+            await asyncio.sleep(delay)
+        except Exception as exc:
+            raise HTTPException(status_code=502, detail=f"Groq API error: {exc}") from exc
 
     summary = ""
     if result.choices:
@@ -61,8 +165,47 @@ def generate_and_store_report(
 
     if not summary:
         raise HTTPException(status_code=502, detail="LLM returned an empty response.")
+    return summary
+
+
+async def generate_and_store_report(
+    db: AsyncSession,
+    record: models.Data,
+    max_words: int = 120,
+    additional_notes: Optional[str] = None,
+) -> str:
+    cache_key = None
+    if report_cache.REPORT_CACHE_ENABLED:
+        # The LLM sees the bucketed prompt too, so a cached report fits every record that maps to it
+        prompt = build_prompt(record, additional_notes, precision=report_cache.REPORT_CACHE_PRECISION)
+        cache_key = report_cache.cache_key(prompt, REPORT_MODEL, max_words)
+        summary = await report_cache.get_cached_report(db, cache_key)
+        if summary is not None:
+            return await _store(db, record, summary, "cache", cache_key)
+    else:
+        prompt = build_prompt(record, additional_notes)
+
+    try:
+        summary = await asyncio.wait_for(request_summary(prompt, max_words), REPORT_DEADLINE_SECONDS)
+    except asyncio.TimeoutError:
+        if not REPORT_FALLBACK:
+            raise HTTPException(status_code=504, detail="Timed out waiting for the report.")
+        return await _store(db, record, template_summary(record), "fallback", None)
+    except HTTPException as exc:
+        if not REPORT_FALLBACK or exc.status_code != 502:
+            raise
+        return await _store(db, record, template_summary(record), "fallback", None)
+
+    if cache_key is not None:
+        await report_cache.store_report(db, cache_key, prompt, summary)
+    return await _store(db, record, summary, "llm", cache_key)
+
 
+async def _store(db: AsyncSession, record: models.Data, summary: str, source: str, cache_key: Optional[str]) -> str:
+    metrics.reports.inc(source=source)
     record.report_text = summary
-    db.commit()
-    db.refresh(record)
+    record.report_source = source
+    record.report_cache_key = cache_key
+    await db.commit()
+    await db.refresh(record)
     return summary
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from typing import Iterable, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from services import metrics
+
+MAX_VIDEO_BYTES = int(os.getenv("MAX_VIDEO_UPLOAD_MB", "1000")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Room for the questionnaire fields and multipart boundaries sent alongside the video.
+_FORM_OVERHEAD_BYTES = 1024 * 1024
+
+
+def _size_error(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File size exceeds the maximum limit of {max_bytes // (1024 * 1024)}MB",
+    )
+
+
+class SpooledUpload:
+    """A video upload streamed to a temporary file in fixed-size chunks."""
+
+    def __init__(
+        self,
+        suffix: str = "",
+        max_bytes: int = MAX_VIDEO_BYTES,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+        directory: Optional[str] = None,
+    ) -> None:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix=suffix, dir=directory)
+        os.close(fd)
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.bytes_written = 0
+        # Hashed as it streams in, so duplicate uploads can be recognised without a second read
+        self._hash = hashlib.sha256()
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the bytes written so far; the whole file once ``write_from`` returns."""
+        return self._hash.hexdigest()
+
+    def _write_chunk(self, out, chunk: bytes) -> None:
+        out.write(chunk)
+        self._hash.update(chunk)
+
+    async def write_from(self, file: UploadFile) -> None:
+        """Copy ``file`` to disk, rejecting it as soon as it crosses ``max_bytes``."""
+        started = time.perf_counter()
+        try:
+            with open(self.path, "wb") as out:
+                while True:
+                    chunk = await file.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    self.bytes_written += len(chunk)
+                    if self.bytes_written > self.max_bytes:
+                        raise _size_error(self.max_bytes)
+                    await asyncio.to_thread(self._write_chunk, out, chunk)
+            if self.bytes_written == 0:
+                raise HTTPException(status_code=400, detail="Empty video file")
+        finally:
+            metrics.observe_stage("upload", time.perf_counter() - started)
+
+    def cleanup(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadLimitMiddleware:
+    """Reject oversized request bodies before they are fully received.
+
+    The declared ``Content-Length`` is checked up front; bodies without one are
+    counted as they stream in and aborted once they cross the limit.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = MAX_VIDEO_BYTES) -> None:
+        self.app = app
+        self.paths = tuple(paths)
+        self.max_bytes = max_bytes
+        self.max_body_bytes = max_bytes + _FORM_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        content_length: Optional[int] = None
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+                break
+
+        if content_length is not None and content_length > self.max_body_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise _size_error(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send) -> None:
+        error = _size_error(self.max_bytes)
+        body = ('{"detail":"%s"}' % error.detail).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,128 @@
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from fastapi import HTTPException
+
+# keras: the .h5 model as-is; tflite-fp16 / tflite-int8: converted artefacts from
+# scripts/convert_video_model.py; xla: the .h5 model behind a jit-compiled tf.function
+VIDEO_MODEL_BACKEND = os.getenv("VIDEO_MODEL_BACKEND", "keras").lower()
+# Threads one TFLite interpreter may use; 0 lets TFLite decide
+TFLITE_THREADS = int(os.getenv("TFLITE_THREADS", "0"))
+# TensorFlow thread pools for the keras/xla backends; 0 lets TensorFlow use every core
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", "0"))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "0"))
+
+BACKENDS = ("keras", "tflite-fp16", "tflite-int8", "xla")
+
+
+def artefact_path(model_path: str, backend: str) -> Path:
+    """Where the converted model for ``backend`` lives, next to the original .h5."""
+    path = Path(model_path)
+    variant = backend.split("-", 1)[1]
+    return path.with_name(f"{path.stem}.{variant}.tflite")
+
+
+def _unavailable(detail: str) -> HTTPException:
+    return HTTPException(status_code=503, detail=detail)
+
+
+def _tensorflow():
+    """Import TensorFlow, sizing its thread pools before the runtime starts."""
+    import tensorflow as tf
+
+    try:
+        if TF_INTRA_OP_THREADS:
+            tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+        if TF_INTER_OP_THREADS:
+            tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+    except RuntimeError:
+        # Already initialised, e.g. by a previously loaded model version; the sizes stay
+        pass
+    return tf
+
+
+class KerasBackend:
+    def __init__(self, model_path: str) -> None:
+        tf = _tensorflow()
+
+        try:
+            self.model = tf.keras.models.load_model(model_path)
+        except (FileNotFoundError, OSError):
+            raise _unavailable("Video model not loaded. Please check server configuration.")
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class XLABackend(KerasBackend):
+    """The Keras model traced once per batch shape and compiled with XLA."""
+
+    def __init__(self, model_path: str) -> None:
+        tf = _tensorflow()
+
+        super().__init__(model_path)
+        self._fn = tf.function(lambda x: self.model(x, training=False), jit_compile=True)
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self._fn(batch).numpy()
+
+
+class TFLiteBackend:
+    """A converted model on the TFLite interpreter.
+
+    Quantised inputs/outputs are converted with the scale and zero point stored
+    in the model, so callers always pass and receive float32 like the Keras model.
+    """
+
+    def __init__(self, model_path: str, num_threads: int = TFLITE_THREADS) -> None:
+        tf = _tensorflow()
+
+        if not Path(model_path).exists():
+            raise _unavailable(
+                f"Converted video model not found at {model_path}. Run scripts/convert_video_model.py first."
+            )
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads or None)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # One interpreter holds one set of tensors; calls must not overlap
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size: int) -> None:
+        if batch_size != self._batch_size:
+            shape = [batch_size, *self._input["shape"][1:]]
+            self.interpreter.resize_tensor_input(self._input["index"], shape)
+            self.interpreter.allocate_tensors()
+            self._input = self.interpreter.get_input_details()[0]
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._resize(len(batch))
+            dtype = self._input["dtype"]
+            if dtype != np.float32:
+                scale, zero_point = self._input["quantization"]
+                info = np.iinfo(dtype)
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+            self.interpreter.set_tensor(self._input["index"], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output["index"])
+            if output.dtype != np.float32:
+                scale, zero_point = self._output["quantization"]
+                output = (output.astype(np.float32) - zero_point) * scale
+            return output.copy()
+
+
+def load_video_backend(model_path: str, backend: str = VIDEO_MODEL_BACKEND):
+    """Load the video model for ``backend``; all backends expose ``predict_on_batch``."""
+    if backend == "keras":
+        return KerasBackend(model_path)
+    if backend == "xla":
+        return XLABackend(model_path)
+    if backend in ("tflite-fp16", "tflite-int8"):
+        return TFLiteBackend(str(artefact_path(model_path, backend)))
+    raise RuntimeError(f"Unknown VIDEO_MODEL_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}.")
@@ -0,0 +1,54 @@
+import os
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import SessionLocal
+
+# Serve re-uploaded videos from the video_results table instead of re-running the video stage
+VIDEO_DEDUP = os.getenv("VIDEO_DEDUP", "true").lower() == "true"
+
+# (label, confidence %, eye gaze %, model version, frames used)
+VideoResult = Tuple[str, float, float, str, int]
+
+
+async def get_video_result(content_hash: Optional[str], model_version: Optional[str]) -> Optional[VideoResult]:
+    """The result previously computed for this content and model version, if any."""
+    if not VIDEO_DEDUP or not content_hash or not model_version:
+        return None
+    # A session of its own, so the caller's objects are never expired by this commit
+    async with SessionLocal() as db:
+        entry = await db.get(models.VideoResult, (content_hash, model_version))
+        if entry is None:
+            return None
+        entry.hits = (entry.hits or 0) + 1
+        entry.last_used_at = datetime.now(timezone.utc)
+        await db.commit()
+        return (
+            entry.video_prediction, entry.video_confidence, entry.eye_gaze_percentage, entry.model_version,
+            entry.frames_used,
+        )
+
+
+async def store_video_result(content_hash: Optional[str], result: VideoResult) -> None:
+    """Store ``result`` under the model version that actually produced it."""
+    label, confidence, gaze_percentage, model_version, frames_used = result
+    if not VIDEO_DEDUP or not content_hash or not model_version:
+        return
+    async with SessionLocal() as db:
+        db.add(models.VideoResult(
+            content_hash=content_hash,
+            model_version=model_version,
+            video_prediction=label,
+            video_confidence=confidence,
+            eye_gaze_percentage=gaze_percentage,
+            frames_used=frames_used,
+            hits=0,
+        ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # The same video was stored by a concurrent request first
+            await db.rollback()